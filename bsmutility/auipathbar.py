@@ -5,7 +5,7 @@ import aui2 as aui
 
 from .bsmxpm import chevron_right_svg, chevron_right_grey_svg, double_right_svg, \
                     double_right_grey_svg, down_svg
-from .utility import svg_to_bitmap, get_path_list
+from .utility import svg_to_bitmap, get_path_list, path_list_completion_count
 from .autocomplete import AutocompleteComboBox
 
 wxEVT_COMMAND_AUIPATHBAR_CLICK = wx.NewEventType()
@@ -82,7 +82,8 @@ class AuiPathBar(wx.Control):
     def completer(self, query):
 
         path, prefix = os.path.split(query)
-        k = get_path_list(path=path, prefix=prefix, files=False, folder_suffix=None)
+        k = get_path_list(path=path, prefix=prefix, files=False, folder_suffix=None,
+                          max_count=path_list_completion_count)
         return k, k, len(prefix)
 
     def SetPathEdit(self, enable):
@@ -0,0 +1,202 @@
+import re
+import sys
+import ast
+import types
+import threading
+import builtins
+from collections import OrderedDict
+from wx.py import introspect
+
+class CompletionCache:
+    """
+    Cache the auto-completion list (attribute names) of the objects in the
+    shell namespace, so the objects are not introspected on every keystroke.
+
+    The attributes of an object are keyed by (root expression, id(obj),
+    includeMagic) and only valid for the namespace version when they are
+    collected; the version is bumped after each command (or when the locals
+    are updated). The attributes of the modules are kept in a separate index
+    (keyed by the module name), which can be built in background for the
+    modules in the namespace.
+
+    The root expression is never evaluated: only the names, attribute chains
+    and subscripts with constant index on the builtin containers (and numpy
+    array, pandas DataFrame/Series) are resolved, and the modules are only
+    looked up in sys.modules (i.e., never imported).
+    """
+    NAME = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+    CONTAINERS = (dict, list, tuple, str)
+
+    def __init__(self, max_size=256):
+        self.version = 0
+        self.max_size = max_size
+        self.objects = OrderedDict()
+        self.modules = {}
+        self.lock = threading.Lock()
+        self.indexer = None
+
+    def invalidate(self, namespace=None):
+        """the namespace may have been changed"""
+        self.version += 1
+        if namespace is not None:
+            self.index_modules(namespace)
+
+    def clear(self):
+        with self.lock:
+            self.objects.clear()
+            self.modules.clear()
+
+    def resolve(self, root, namespace):
+        """return the object of the root expression, or None"""
+        root = root.strip()
+        if not root:
+            return None
+        if self.NAME.match(root):
+            return self._resolve_name(root, namespace)
+        try:
+            tree = ast.parse(root, mode='eval')
+        except SyntaxError:
+            return None
+        try:
+            return self._resolve_node(tree.body, namespace)
+        except Exception:
+            return None
+
+    def _resolve_node(self, node, namespace):
+        if isinstance(node, ast.Name):
+            return self._resolve_name(node.id, namespace)
+        if isinstance(node, ast.Attribute):
+            obj = self._resolve_node(node.value, namespace)
+            if obj is None:
+                return None
+            return self._getattr(obj, node.attr)
+        if isinstance(node, ast.Subscript):
+            obj = self._resolve_node(node.value, namespace)
+            index = node.slice
+            if isinstance(index, ast.Index):
+                # python < 3.9
+                index = index.value
+            if isinstance(index, ast.Tuple) and \
+                    all(isinstance(e, ast.Constant) for e in index.elts):
+                # e.g., x[0, 1]
+                index = tuple(e.value for e in index.elts)
+            elif isinstance(index, ast.Constant):
+                index = index.value
+            else:
+                return None
+            if type(obj) not in self.containers():
+                return None
+            return obj[index]
+        if isinstance(node, ast.Constant):
+            return node.value
+        return None
+
+    def containers(self):
+        """the types whose __getitem__ has no side effect"""
+        containers = list(self.CONTAINERS)
+        # not import numpy/pandas if they are not used
+        np = sys.modules.get('numpy', None)
+        if np is not None:
+            containers.append(np.ndarray)
+        pd = sys.modules.get('pandas', None)
+        if pd is not None:
+            containers += [pd.DataFrame, pd.Series]
+        return containers
+
+    def _getattr(self, obj, attr):
+        if isinstance(obj, types.ModuleType):
+            # the sub-module may not be an attribute of its package yet
+            val = vars(obj).get(attr, None)
+            if val is None:
+                val = sys.modules.get(f'{obj.__name__}.{attr}', None)
+            if val is not None:
+                return val
+        try:
+            return getattr(obj, attr)
+        except Exception:
+            return None
+
+    def _resolve_name(self, root, namespace):
+        components = root.split('.')
+        name = components[0]
+        if name in namespace:
+            obj = namespace[name]
+        elif hasattr(builtins, name):
+            obj = getattr(builtins, name)
+        else:
+            obj = sys.modules.get(name, None)
+        for comp in components[1:]:
+            if obj is None:
+                break
+            obj = self._getattr(obj, comp)
+        return obj
+
+    def _module_attributes(self, mod):
+        # the module attributes are re-collected only when its dict changes
+        key = (mod.__name__, len(vars(mod)))
+        with self.lock:
+            names = self.modules.get(mod.__name__, None)
+        if names is not None and names[0] == key:
+            return names[1]
+        attributes = introspect.getAttributeNames(mod)
+        with self.lock:
+            self.modules[mod.__name__] = (key, attributes)
+        return attributes
+
+    def attributes(self, obj, root='', includeMagic=1):
+        """return all the attribute names of obj"""
+        if isinstance(obj, types.ModuleType) and \
+                isinstance(getattr(obj, '__name__', None), str) and \
+                (includeMagic or not hasattr(obj, '_getAttributeNames')):
+            # the module index always includes the magic attributes, which
+            # only differ when the module has _getAttributeNames
+            return self._module_attributes(obj)
+        key = (root, id(obj), bool(includeMagic))
+        with self.lock:
+            item = self.objects.get(key, None)
+            if item is not None and item[0] == self.version:
+                self.objects.move_to_end(key)
+                return item[1]
+        attributes = introspect.getAttributeNames(obj, includeMagic)
+        with self.lock:
+            self.objects[key] = (self.version, attributes)
+            self.objects.move_to_end(key)
+            while len(self.objects) > self.max_size:
+                self.objects.popitem(last=False)
+        return attributes
+
+    def get(self, root, namespace, includeMagic=1, includeSingle=1,
+            includeDouble=1):
+        """return the auto-completion list of the root expression"""
+        obj = self.resolve(root, namespace)
+        if obj is None and root.strip() != 'None':
+            return []
+        attributes = self.attributes(obj, root.strip(), includeMagic)
+        if not includeSingle:
+            attributes = [a for a in attributes if a[0] != '_' or a[1:2] == '_']
+        if not includeDouble:
+            attributes = [a for a in attributes if a[:2] != '__']
+        return list(attributes)
+
+    def index_modules(self, namespace):
+        """collect the attributes of the modules in namespace in background"""
+        if self.indexer is not None and self.indexer.is_alive():
+            return
+        mods = [m for m in list(namespace.values())
+                if isinstance(m, types.ModuleType)]
+        with self.lock:
+            mods = [m for m in mods
+                    if isinstance(getattr(m, '__name__', None), str) and
+                    self.modules.get(m.__name__, [None])[0] != (m.__name__, len(vars(m)))]
+        if not mods:
+            return
+
+        def _index():
+            for m in mods:
+                try:
+                    self._module_attributes(m)
+                except Exception:
+                    pass
+
+        self.indexer = threading.Thread(target=_index, daemon=True)
+        self.indexer.start()
@@ -1,5 +1,11 @@
 import os
+import sys
+import io
+import traceback
 import json
+import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import wx
 
@@ -24,50 +30,283 @@ def hinted_tuple_hook(obj):
         return obj
 
 
+def encode_config_value(value):
+    if not isinstance(value, str):
+        # add sign to indicate that the value needs to be deserialize
+        enc = MultiDimensionalArrayEncoder()
+        value = '__bsm__' + enc.encode(value)
+    return value
+
+def decode_config_value(value):
+    if value.startswith('__bsm__'):
+        value = json.loads(value[7:], object_hook=hinted_tuple_hook)
+    return value
+
+
+class FileConfigStore:
+    """store the config in INI file with wx.FileConfig"""
+
+    def __init__(self, filename, config=None):
+        self.filename = filename
+        if config is None:
+            config = wx.FileConfig(localFilename=filename)
+        self.config = config
+
+        # the writes run in background thread, use the version to make sure
+        # an older content will not overwrite a newer one
+        self._version = 0
+        self._written_version = 0
+        self._write_lock = threading.Lock()
+        self._writer = None
+
+    def Write(self, group, key, value):
+        self.config.SetPath(group)
+        self.config.Write(key, value)
+
+    def Read(self, group, key):
+        if self.config.HasGroup(group):
+            self.config.SetPath(group)
+            if self.config.HasEntry(key):
+                return self.config.Read(key)
+        return None
+
+    def ReadGroup(self, group):
+        if not self.config.HasGroup(group):
+            return None
+        self.config.SetPath(group)
+        rst = {}
+        more, k, index = self.config.GetFirstEntry()
+        while more:
+            rst[k] = self.config.Read(k)
+            more, k, index = self.config.GetNextEntry(index)
+        # same as SQLiteConfigStore, None for the group without entry
+        return rst or None
+
+    def Flush(self, wait=True):
+        """
+        write the changes to disk; if wait is False, the file is written in a
+        background thread.
+        """
+        if wait:
+            self.Wait()
+        # wx.FileConfig is not thread safe, serialize it in the GUI thread
+        stream = io.BytesIO()
+        self.config.Save(stream)
+        self._version += 1
+        data, version = stream.getvalue(), self._version
+        if wait:
+            self._write(data, version)
+        else:
+            self._writer = threading.Thread(target=self._write,
+                                            args=(data, version), daemon=True)
+            self._writer.start()
+
+    def Wait(self):
+        """wait for the pending background write"""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def _write(self, data, version):
+        # write to a temporary file, then rename it, so the config file will
+        # not be corrupted if the app crashes in the middle of writing
+        with self._write_lock:
+            if version <= self._written_version:
+                # a newer version has been written
+                return
+            tmp = self.filename + '.tmp'
+            try:
+                with open(tmp, 'wb') as fp:
+                    fp.write(data)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                os.replace(tmp, self.filename)
+                self._written_version = version
+            except OSError:
+                traceback.print_exc(file=sys.stdout)
+
+
+class SQLiteConfigStore:
+    """
+    store the config in SQLite database, so each change only updates its own
+    row, instead of rewriting the whole file.
+
+    It may be accessed from other threads (e.g., the shell worker), so the
+    connection is shared and serialized by a lock.
+    """
+
+    def __init__(self, filename, migrate_from=None):
+        self.filename = filename
+        self.lock = threading.RLock()
+        # autocommit, each write is a single upsert
+        self.db = sqlite3.connect(filename, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS config ('
+                        'grp TEXT NOT NULL, key TEXT NOT NULL, value TEXT, '
+                        'PRIMARY KEY (grp, key))')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            # first time, import the settings from the INI file
+            if isinstance(migrate_from, str) and os.path.isfile(migrate_from):
+                migrate_from = wx.FileConfig(localFilename=migrate_from)
+            if isinstance(migrate_from, wx.ConfigBase):
+                self.Migrate(migrate_from)
+            self.db.execute('PRAGMA user_version=1')
+
+    def Migrate(self, config):
+        """copy all the entries from wx.ConfigBase"""
+        rows = []
+        def _read(path):
+            config.SetPath(path)
+            more, k, index = config.GetFirstEntry()
+            while more:
+                rows.append((path.rstrip('/') or '/', k, config.Read(k)))
+                more, k, index = config.GetNextEntry(index)
+            groups = []
+            more, g, index = config.GetFirstGroup()
+            while more:
+                groups.append(g)
+                more, g, index = config.GetNextGroup(index)
+            for g in groups:
+                _read(path.rstrip('/') + '/' + g)
+        _read('/')
+        config.SetPath('/')
+        with self.lock, self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany('INSERT OR REPLACE INTO config VALUES (?, ?, ?)', rows)
+
+    def Write(self, group, key, value):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO config VALUES (?, ?, ?)',
+                            (group, key, value))
+
+    def Read(self, group, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM config WHERE grp=? AND key=?',
+                                  (group, key)).fetchone()
+        return row[0] if row is not None else None
+
+    def ReadGroup(self, group):
+        with self.lock:
+            rows = self.db.execute('SELECT key, value FROM config WHERE grp=?',
+                                   (group,)).fetchall()
+        if not rows:
+            return None
+        return dict(rows)
+
+    def Flush(self, wait=True):
+        # each write has been committed
+        return
+
+    def Wait(self):
+        return
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
+
+
+def create_config_store(filename, backend='ini', config=None):
+    """
+    create the config store
+
+    filename: the INI file; for 'sqlite' backend, the database is
+        '{filename}.db', and the INI file (if exists) is migrated to it on
+        the first run.
+    config: the wx.FileConfig instance already opened for the INI file.
+    """
+    if backend == 'sqlite':
+        return SQLiteConfigStore(filename + '.db',
+                                 migrate_from=config if config is not None else filename)
+    return FileConfigStore(filename, config=config)
+
+
 class ConfigFile:
-    def __init__(self, filename, foler='bsmutility'):
+    # delay (ms) to write the changes to disk; the timer restarts on each
+    # change, so a burst of changes is written only once
+    FLUSH_DELAY = 1000
+    # default storage backend, 'ini' or 'sqlite'
+    BACKEND = 'ini'
+
+    def __init__(self, filename, foler='bsmutility', backend=None):
         # create folder
         s = wx.StandardPaths.Get()
         cfg = os.path.join(s.GetUserConfigDir(), foler)
         Path(cfg).mkdir(parents=True, exist_ok=True)
 
-        self.config = wx.FileConfig(localFilename=os.path.join(cfg, filename))
+        self.filename = os.path.join(cfg, filename)
+        self.store = create_config_store(self.filename, backend or self.BACKEND)
+
+        self._batch = 0
+        self._dirty = False
+        self._flush_timer = None
 
     def SetConfig(self, group, flush=True, **kwargs):
         if not group.startswith('/'):
             group = '/' + group
         for key, value in kwargs.items():
-            if not isinstance(value, str):
-                # add sign to indicate that the value needs to be deserialize
-                enc = MultiDimensionalArrayEncoder()
-                value = '__bsm__' + enc.encode(value)
-            self.config.SetPath(group)
-            self.config.Write(key, value)
-        if flush:
-            self.Flush()
+            self.store.Write(group, key, encode_config_value(value))
+        self._dirty = True
+        if flush and self._batch == 0:
+            self.ScheduleFlush()
 
     def GetConfig(self, group, key=None):
         if not group.startswith('/'):
             group = '/' + group
-        if self.config.HasGroup(group):
-            self.config.SetPath(group)
-            if key is None:
-                rst = {}
-                more, k, index = self.config.GetFirstEntry()
-                while more:
-                    value = self.config.Read(k)
-                    if value.startswith('__bsm__'):
-                        value = json.loads(value[7:], object_hook=hinted_tuple_hook)
-                    rst[k] = value
-                    more, k, index = self.config.GetNextEntry(index)
-                return rst
+        if key is None:
+            rst = self.store.ReadGroup(group)
+            if rst is None:
+                return None
+            return {k: decode_config_value(v) for k, v in rst.items()}
 
-            if self.config.HasEntry(key):
-                value = self.config.Read(key)
-                if value.startswith('__bsm__'):
-                    value = json.loads(value[7:], object_hook=hinted_tuple_hook)
-                return value
+        value = self.store.Read(group, key)
+        if value is not None:
+            return decode_config_value(value)
         return None
 
-    def Flush(self):
-        self.config.Flush()
+    @contextmanager
+    def Batch(self):
+        """
+        group the changes, and only schedule the flush when the outermost
+        batch exits, e.g.,
+
+            with config.Batch():
+                config.SetConfig('conversion', converted_item=...)
+                config.SetConfig('xaxis', path=...)
+        """
+        self._batch += 1
+        try:
+            yield self
+        finally:
+            self._batch -= 1
+            if self._batch == 0 and self._dirty:
+                self.ScheduleFlush()
+
+    def ScheduleFlush(self):
+        """write the changes to disk after FLUSH_DELAY ms of inactivity"""
+        if self._flush_timer is None:
+            self._flush_timer = wx.CallLater(self.FLUSH_DELAY, self._OnFlushTimer)
+        else:
+            # restart the timer
+            self._flush_timer.Start(self.FLUSH_DELAY)
+
+    def _OnFlushTimer(self):
+        self._flush_timer = None
+        self.Flush(wait=False)
+
+    def Flush(self, wait=True):
+        """
+        write the changes to disk; if wait is False, the file may be written
+        in a background thread.
+        """
+        if self._flush_timer is not None:
+            self._flush_timer.Stop()
+            self._flush_timer = None
+        if not self._dirty:
+            if wait:
+                self.store.Wait()
+            return
+        self._dirty = False
+        self.store.Flush(wait=wait)
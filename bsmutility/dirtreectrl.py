@@ -272,6 +272,10 @@ class DirMixin:
                     self.iconentries[ext] = iconkey
                     # update tree with new imagelist - inefficient
                     #self.SetImageList(self.imagelist)
+                else:
+                    # no icon for this extension, use the default one, so it
+                    # will not be queried again
+                    self.iconentries[ext] = self.iconentries['default']
 
             if ext in self.iconentries:
                 return self.iconentries[ext]
@@ -739,9 +743,9 @@ class DirWithColumnsMixin(DirMixin):
             cols = resp[0][1]
             if len(cols) == len(self.columns):
                 for idx, col in enumerate(self.columns):
-                    cols[idx].pop('id', None)
-                    cols[idx].pop('optional', None)
-                    col.update(cols[idx])
+                    # the config value is read-only
+                    col.update({k: v for k, v in cols[idx].items()
+                                if k not in ('id', 'optional')})
 
         resp = dp.send('frame.get_config', group='dirlistctrl', key='columns_shown')
         if resp and resp[0][1] is not None:
@@ -41,7 +41,8 @@ class EditorThemeMixin:
         resp = dp.send('frame.get_config', group='theme', key=theme)
         themes = None
         if resp and resp[0][1] is not None:
-            themes = resp[0][1]
+            # the config value is read-only
+            themes = dict(resp[0][1])
         themes_default = {'color': self.GetThemeColor(theme),
                           'font': self.GetThemeFont(theme)}
         if themes is None:
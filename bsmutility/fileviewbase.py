@@ -62,6 +62,11 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
                                     'outputs': '~yaw, ~pitch, ~roll',
                                     'equation': 'Quaternion(#w, #x, #y, #z).to_angle()',
                                     'force_select_signal': True},
+                                {'label': 'Rotate vector by quaternion',
+                                    'inputs': ['#w', '#x', '#y', '#z', '#vx', '#vy', '#vz'],
+                                    'outputs': '#vx_rot, #vy_rot, #vz_rot',
+                                    'equation': 'Quaternion(#w, #x, #y, #z).rotate(np.column_stack([#vx, #vy, #vz])).T',
+                                    'force_select_signal': True},
                                 {'label': 'Radian to degree',
                                     'inputs': ['#1'],
                                     'outputs': '#_deg',
@@ -355,7 +360,7 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
         if equation is None or force_select_signal or N_IN != len(items):
             # settings is none, get it from user
             start = ''
-            if parent != self.GetRootItem():
+            if parent != self.GetRootItem() and not settings.get('cross_parent', False):
                 # limit the signal to be children of parent
                 start = self.GetItemName(parent)
             values = {f'{inputs[i]}': settings.get(f'{inputs[i]}', '') for i in range(N_IN)}
@@ -385,13 +390,14 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
             outputs = outputs or f'~{text}'
             outputs = outputs.replace('#', text)
 
-        d = self.doConvertFromSetting(settings)
+        # add the converted data to parent DataFrame (same level as item)
+        path = self.GetItemPath(parent)
+
+        d = self.doConvertFromSetting(settings, parent=path)
 
         if d is None:
             return None, settings
 
-        # add the converted data to parent DataFrame (same level as item)
-        path = self.GetItemPath(parent)
         outputs = [n.strip() for n in outputs.split(',')]
         if len(outputs) == 1:
             d = [d]
@@ -433,7 +439,7 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
                 force_select_signal=False, **kwargs)
 
     def AddConvert(self, p, idx, settings):
-        d = self.doConvertFromSetting(settings)
+        d = self.doConvertFromSetting(settings, parent=get_tree_item_path(p)[:-1])
         if d is None:
             return False
         if idx[0] > 1:
@@ -442,7 +448,7 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
         self._converted_item[p] = [idx, settings]
         return True
 
-    def doConvertFromSetting(self, settings):
+    def doConvertFromSetting(self, settings, parent=None):
         inputs = settings.get('inputs', ['x'])
         args = settings.get('args', None)
         equation = settings.get('equation', None)
@@ -459,13 +465,14 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
             paths.append(get_tree_item_path(f'{signal}'))
             # replace input name (e.g., #w) with input index (e.g., #1)
             equation = equation.replace(f'#{inputs[i].lstrip("#")}', f'#{i+1}')
-        return self.doConvert(paths, args, equation)
+        return self.doConvert(paths, args, equation, parent=parent)
 
-    def doConvert(self, paths, args, equation):
+    def doConvert(self, paths, args, equation, parent=None):
         # calculate equation(paths)
         # paths are path of input items
         # and equation may look like foo(#1, #2, #3, ...), e.g., where #1 will
         # be replaced with data from paths[0], etc.
+        # parent is the path of the node to save the outputs
         data = []
         for path in paths:
             d = self.GetItemDataFromPath(path)
@@ -490,7 +497,9 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
             # get the locals from shell, to reuse the functions/modules
             resp = dp.send('shell.get_locals')
             if resp:
-                local = resp[0][1]
+                # not change the shell namespace (the command may be running
+                # in it in the worker thread)
+                local = dict(resp[0][1])
                 local.update(locals())
             else:
                 local = locals()
@@ -741,8 +750,7 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
     def Load(self, data, filename=None):
         """load the dict data"""
         self.data = data
-        if self.config_file:
-            self.config_file.Flush()
+        self.FlushConfig()
         self.config_file = None
         self.filename = filename
         if filename:
@@ -754,13 +762,14 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
             x_path = self.config_file.GetConfig(self.XAXIS, 'path')
 
             converted_item = self.config_file.GetConfig('conversion', 'converted_item')
-            if converted_item is not None and not wx.GetKeyState(wx.WXK_SHIFT):
-                for p, c in converted_item.items():
-                    idx, settings = c
-                    self.AddConvert(p, idx, settings)
-            # reload the x_path after converted_item, as the converted_item may
-            # change the x_path
-            self.SetXaxisPath(x_path)
+            with self.config_file.Batch():
+                if converted_item is not None and not wx.GetKeyState(wx.WXK_SHIFT):
+                    for p, c in converted_item.items():
+                        idx, settings = c
+                        self.AddConvert(p, idx, settings)
+                # reload the x_path after converted_item, as the converted_item may
+                # change the x_path
+                self.SetXaxisPath(x_path)
 
         self.Fill(self.pattern)
 
@@ -897,6 +906,11 @@ class TreeCtrlBase(FastLoadTreeCtrl, FindTreeMixin):
         if self.config_file:
             self.config_file.SetConfig(self.XAXIS, path=self.x_path)
 
+    def FlushConfig(self):
+        """write the pending changes of the config file to disk"""
+        if self.config_file:
+            self.config_file.Flush()
+
     def RefreshChildren(self, item):
         super().RefreshChildren(item)
         if self.x_path:
@@ -932,6 +946,17 @@ class TreeCtrlWithTimeStamp(TreeCtrlBase):
         super().__init__(parent, style=style)
         # hide the "timestamp"
         self.exclude_keys = [self.timestamp_key]
+        # the quaternion may be from other node (e.g., with different sample
+        # rate), resample it to the timestamp of the selected item
+        ts_src = 'self.GetItemTimeStampFromPath(paths[0])'
+        ts_dst = f'self.GetItemTimeStampFromPath(parent + ["{self.timestamp_key}"])'
+        self.common_convert.append(
+                {'label': 'Resample quaternion to timestamp (SLERP)',
+                 'inputs': ['#w', '#x', '#y', '#z'],
+                 'outputs': '#w_slerp, #x_slerp, #y_slerp, #z_slerp',
+                 'equation': f'Quaternion(#w, #x, #y, #z).resample({ts_src}, {ts_dst}).to_list()',
+                 'force_select_signal': True,
+                 'cross_parent': True})
 
     def interpolate(self, t1, v1, t2):
         # interpolate (v1, t1) to (v2, t2)
@@ -1448,6 +1473,11 @@ class PanelNotebookBase(PanelBase):
     def init_pages(self):
         return
 
+    def Destroy(self):
+        if isinstance(self.tree, TreeCtrlBase):
+            self.tree.FlushConfig()
+        super().Destroy()
+
     def CreatePageWithSearch(self, PageClass):
         panel = wx.Panel(self.notebook)
         search = AutocompleteTextCtrl(panel)
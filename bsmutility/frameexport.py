@@ -0,0 +1,143 @@
+import os
+import sys
+import zipfile
+import threading
+import traceback
+import numpy as np
+import matplotlib.image as mpimg
+
+def guess_export_format(filename):
+    """return the export format from the file extension"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.npz':
+        return 'npz'
+    if ext in ('.h5', '.hdf5'):
+        return 'h5'
+    if ext in ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'):
+        return 'image'
+    raise ValueError(f'Not supported file format: {filename}')
+
+class FrameExporter(threading.Thread):
+    """
+    Export the frames (num x rows x cols array-like, e.g., the frame buffer of
+    the glsurface) in a background thread, one chunk at a time, so the whole
+    buffer is never copied in memory.
+
+    index is the frame indices to export (in order), and the file format is
+    from the file extension,
+        npz: compressed numpy file with 'frames' and 'timestamps'
+        h5/hdf5: HDF5 file with 'frames' and 'timestamps' datasets (h5py)
+        png/jpg/tif/bmp: image sequence, e.g., frame_00000.png, ...
+
+    progress(done, total, finished) is called from the worker thread after
+    each chunk.
+    """
+    def __init__(self, frames, index, filename, timestamps=None, cmap=None,
+                 vmin=None, vmax=None, chunk=64, progress=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.frames = frames
+        self.index = np.asarray(index, dtype=int)
+        self.filename = filename
+        self.fmt = guess_export_format(filename)
+        self.timestamps = timestamps
+        self.cmap = cmap
+        self.vmin, self.vmax = vmin, vmax
+        self.chunk = max(int(chunk), 1)
+        self.progress = progress
+        self.done = 0
+        self.total = len(self.index)
+        self.error = None
+        self.cancelled = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        files = []
+        try:
+            if self.fmt == 'npz':
+                files.append(self.filename)
+                self._write_npz()
+            elif self.fmt == 'h5':
+                files.append(self.filename)
+                self._write_h5()
+            else:
+                self._write_images(files)
+            self.cancelled = self._cancel.is_set()
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            self.error = e
+        if self.cancelled or self.error is not None:
+            # remove the partial output
+            for f in files:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+        self._notify(True)
+        # release the buffer
+        self.frames = None
+
+    def _notify(self, finished=False):
+        if self.progress is not None:
+            self.progress(self.done, self.total, finished)
+
+    def _chunks(self):
+        for start in range(0, self.total, self.chunk):
+            if self._cancel.is_set():
+                return
+            idx = self.index[start:start + self.chunk]
+            if isinstance(self.frames, np.ndarray):
+                d = self.frames[idx]
+            else:
+                # e.g., FrameSource
+                d = np.stack([self.frames[int(i)] for i in idx])
+            yield start, d
+            self.done = start + len(idx)
+            self._notify()
+
+    def _frame_shape(self):
+        if hasattr(self.frames, 'shape'):
+            return tuple(self.frames.shape[1:]), np.dtype(self.frames.dtype)
+        frame = np.asarray(self.frames[int(self.index[0])])
+        return frame.shape, frame.dtype
+
+    def _write_npz(self):
+        shape, dtype = self._frame_shape()
+        header = {'descr': np.lib.format.dtype_to_descr(dtype),
+                  'fortran_order': False,
+                  'shape': (self.total,) + shape}
+        with zipfile.ZipFile(self.filename, 'w', zipfile.ZIP_DEFLATED,
+                             allowZip64=True) as zf:
+            with zf.open('frames.npy', 'w', force_zip64=True) as fp:
+                np.lib.format.write_array_header_2_0(fp, header)
+                for _, d in self._chunks():
+                    fp.write(np.ascontiguousarray(d, dtype=dtype).tobytes())
+            if self.timestamps is not None:
+                with zf.open('timestamps.npy', 'w') as fp:
+                    np.lib.format.write_array(fp, np.asarray(self.timestamps))
+
+    def _write_h5(self):
+        try:
+            import h5py
+        except ImportError:
+            raise ValueError('h5py is required to export HDF5 file')
+        shape, dtype = self._frame_shape()
+        with h5py.File(self.filename, 'w') as f:
+            ds = f.create_dataset('frames', (self.total,) + shape, dtype=dtype,
+                                  chunks=(1,) + shape, compression='gzip')
+            for start, d in self._chunks():
+                ds[start:start + len(d)] = d
+            if self.timestamps is not None:
+                f.create_dataset('timestamps', data=np.asarray(self.timestamps))
+
+    def _write_images(self, files):
+        root, ext = os.path.splitext(self.filename)
+        digits = len(str(max(self.total - 1, 0)))
+        for start, d in self._chunks():
+            for i, frame in enumerate(d):
+                filename = f'{root}_{start + i:0{digits}d}{ext}'
+                files.append(filename)
+                mpimg.imsave(filename, frame, cmap=self.cmap, vmin=self.vmin,
+                             vmax=self.vmax)
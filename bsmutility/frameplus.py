@@ -1,14 +1,16 @@
 import sys
 import traceback
 import importlib
-import json
 import pkgutil
 import six
 import wx
 import wx.py.dispatcher as dp
 import aui2 as aui
-from .utility import build_menu_from_list, svg_to_bitmap
-from .bsmxpm import restore_svg
+from .configfile import create_config_store, encode_config_value, \
+                        decode_config_value
+from .utility import build_menu_from_list, svg_to_bitmap, warm_up_svg_bitmap
+from .bsmxpm import restore_svg, open_svg, refresh_svg, refresh_grey_svg, \
+                    more_svg, save_svg, save_gray_svg, copy_svg, copy_gray_svg
 
 class FileDropTarget(wx.FileDropTarget):
     def __init__(self, frame):
@@ -66,27 +68,6 @@ class AuiManagerPlus(aui.AuiManager):
         # main frame
         event.Skip()
 
-class MultiDimensionalArrayEncoder(json.JSONEncoder):
-    def encode(self, o):
-        def hint_tuples(item):
-            if isinstance(item, tuple):
-                return {'__tuple__': True, 'items': item}
-            if isinstance(item, list):
-                return [hint_tuples(e) for e in item]
-            if isinstance(item, dict):
-                return {key: hint_tuples(value) for key, value in item.items()}
-            else:
-                return item
-
-        return super().encode(hint_tuples(o))
-
-def hinted_tuple_hook(obj):
-    if '__tuple__' in obj:
-        return tuple(obj['items'])
-    else:
-        return obj
-
-
 class TaskBarIcon(wx.adv.TaskBarIcon):
     TBMENU_RESTORE = wx.NewIdRef()
     TBMENU_CLOSE = wx.NewIdRef()
@@ -147,6 +128,8 @@ class TaskBarIcon(wx.adv.TaskBarIcon):
 
 class FramePlus(wx.Frame):
     CONFIG_NAME='bsm'
+    # mark the (group, key) not in config in the decoded value cache
+    _CONFIG_MISSING = object()
     ID_SHOW_TAB_BOTTOM = wx.NewIdRef()
     ID_SHOW_WINDOWLIST = wx.NewIdRef()
 
@@ -166,6 +149,9 @@ class FramePlus(wx.Frame):
         self._mgr.SetManagedWindow(self)
         self._mgr.GetArtProvider().SetMetric(aui.AUI_DOCKART_PANE_BUTTON_SIZE, 25)
         self._mgr.SetRestoreButtonBitmap(svg_to_bitmap(restore_svg, win=self))
+        # rasterize the common toolbar icons once, so the panels created later
+        # will get them from the cache
+        warm_up_svg_bitmap(self.GetWarmUpIcons(), win=self)
         self.menuAddon = {}
         self.paneAddon = {}
         self.paneMenu = {}
@@ -174,6 +160,14 @@ class FramePlus(wx.Frame):
         # persistent configuration
         conf = kwargs.get('config', self.CONFIG_NAME)
         self.config = wx.FileConfig(conf, style=wx.CONFIG_USE_LOCAL_FILE)
+        # the storage for SetConfig/GetConfig, 'ini' (default) or 'sqlite';
+        # the file history is always saved in the INI file
+        conf_file = wx.FileConfig.GetLocalFileName(conf, wx.CONFIG_USE_LOCAL_FILE)
+        self.config_store = create_config_store(conf_file,
+                                                kwargs.get('config_backend', 'ini'),
+                                                config=self.config)
+        # decoded values of the config, {(group, key): value}
+        self._config_cache = {}
 
         self.closing = False
         self.InitMenu()
@@ -333,6 +327,10 @@ class FramePlus(wx.Frame):
     def GetDefaultAddonPackages(self):
         return []
 
+    def GetWarmUpIcons(self):
+        return [open_svg, refresh_svg, refresh_grey_svg, more_svg, save_svg,
+                save_gray_svg, copy_svg, copy_gray_svg]
+
     def GetAbsoluteAddonPath(self, pkg):
         return pkg
 
@@ -496,43 +494,60 @@ class FramePlus(wx.Frame):
             if key in ['signal', 'sender']:
                 # reserved key for dp.send
                 continue
-            if not isinstance(value, str):
-                # add sign to indicate that the value needs to be deserialize
-                enc = MultiDimensionalArrayEncoder()
-                value = '__bsm__' + enc.encode(value)
-            self.config.SetPath(group)
-            self.config.Write(key, value)
+            self.config_store.Write(group, key, encode_config_value(value))
+            # decoded again on the next read, so the cache is not affected by
+            # the caller's object
+            self._config_cache.pop((group, key), None)
 
     def GetConfig(self, group, key=None, default=None):
         if not group.startswith('/'):
             group = '/' + group
-        if self.config.HasGroup(group):
-            self.config.SetPath(group)
-            if key is None:
-                rst = {}
-                more, k, index = self.config.GetFirstEntry()
-                while more:
-                    value = self.config.Read(k)
-                    if value.startswith('__bsm__'):
-                        try:
-                            value = json.loads(value[7:], object_hook=hinted_tuple_hook)
-                        except:
-                            traceback.print_exc(file=sys.stdout)
-                            continue
-                    rst[k] = value
-                    more, k, index = self.config.GetNextEntry(index)
-                return rst
-
-            if self.config.HasEntry(key):
-                value = self.config.Read(key)
-                if value.startswith('__bsm__'):
-                    try:
-                        value = json.loads(value[7:], object_hook=hinted_tuple_hook)
-                    except:
-                        value = default
-                        traceback.print_exc(file=sys.stdout)
-                return value
-        return default
+        if key is None:
+            values = self.config_store.ReadGroup(group)
+            if values is None:
+                return default
+            rst = {}
+            for k, value in values.items():
+                try:
+                    rst[k] = decode_config_value(value)
+                except:
+                    traceback.print_exc(file=sys.stdout)
+                    continue
+            return rst
+
+        value = self._config_cache.get((group, key), None)
+        if value is None:
+            value = self.config_store.Read(group, key)
+            if value is not None:
+                try:
+                    value = decode_config_value(value)
+                except:
+                    traceback.print_exc(file=sys.stdout)
+                    return default
+            else:
+                value = self._CONFIG_MISSING
+            self._config_cache[(group, key)] = value
+        if value is self._CONFIG_MISSING:
+            return default
+        # the cached value is shared by all the readers, i.e., it is read-only;
+        # copy it before modifying (and call SetConfig to save the change)
+        return value
+
+    def InvalidateConfig(self, group=None, key=None):
+        """
+        remove the decoded values from cache, so they will be read from the
+        config store again; group is None to clear all the cache.
+        """
+        if group is None:
+            self._config_cache.clear()
+            return
+        if not group.startswith('/'):
+            group = '/' + group
+        if key is not None:
+            self._config_cache.pop((group, key), None)
+            return
+        for k in [k for k in self._config_cache if k[0] == group]:
+            self._config_cache.pop(k)
 
     def LoadPerspective(self):
         perspective = self.GetConfig('mainframe', 'perspective')
@@ -562,7 +577,10 @@ class FramePlus(wx.Frame):
         # triggered in 1st step to be processed
         if self.closing or not event.CanVeto():
             # step 2 finished all clean-up, do the actual close now
-            self.config.Flush()
+            self.config_store.Flush()
+            if getattr(self.config_store, 'config', None) is not self.config:
+                # the file history is still in the INI file
+                self.config.Flush()
             event.Skip()
             return
 
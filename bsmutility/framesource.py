@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class FrameSource:
+    """
+    Read-only frame buffer (num x rows x cols) backed by a np.memmap (or any
+    array-like) or a frame provider, i.e., an object with __len__ and
+    get_frame(i). Only the frames being shown are loaded, with a small LRU
+    cache, and the next frames in the playing direction are read ahead in
+    background.
+
+    The provider may also implement get_pixel(r, c) to return the value of
+    pixel (r, c) in all frames; otherwise, the pixel history only includes the
+    frames loaded so far (nan for others).
+    """
+    def __init__(self, source, cache_size=32, read_ahead=4):
+        self.source = source
+        self.is_provider = hasattr(source, 'get_frame')
+        self.cache_size = max(cache_size, read_ahead + 1)
+        self.read_ahead = read_ahead
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        # the source may not be thread-safe, read one frame at a time
+        self.read_lock = threading.Lock()
+        self.executor = None
+        self.pending = set()
+        self.last_index = None
+        frame = self._read(0)
+        self.num = len(source)
+        self.shape = (self.num,) + frame.shape
+        self.dtype = frame.dtype
+        self.size = int(np.prod(self.shape))
+        self._add(0, frame)
+
+    def __len__(self):
+        return self.num
+
+    @property
+    def nbytes_cached(self):
+        with self.lock:
+            return sum(f.nbytes for f in self.cache.values())
+
+    def _read(self, i):
+        with self.read_lock:
+            if self.is_provider:
+                frame = self.source.get_frame(i)
+            else:
+                frame = self.source[i]
+            return np.array(frame)
+
+    def _add(self, i, frame):
+        with self.lock:
+            self.cache[i] = frame
+            self.cache.move_to_end(i)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _prefetch(self, i):
+        try:
+            self._add(i, self._read(i))
+        finally:
+            with self.lock:
+                self.pending.discard(i)
+
+    def get_frame(self, i):
+        if i < 0:
+            i += self.num
+        if not 0 <= i < self.num:
+            raise IndexError('frame index out of range')
+        with self.lock:
+            frame = self.cache.get(i, None)
+            if frame is not None:
+                self.cache.move_to_end(i)
+        if frame is None:
+            frame = self._read(i)
+            self._add(i, frame)
+
+        # read ahead in the playing direction; it may be called from multiple
+        # threads (e.g., the export thread)
+        if self.read_ahead <= 0:
+            return frame
+        with self.lock:
+            step = -1 if self.last_index is not None and i < self.last_index else 1
+            self.last_index = i
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            for k in range(1, self.read_ahead + 1):
+                j = i + k * step
+                if not 0 <= j < self.num:
+                    break
+                if j in self.cache or j in self.pending:
+                    continue
+                self.pending.add(j)
+                self.executor.submit(self._prefetch, j)
+        return frame
+
+    def get_pixel(self, r, c):
+        """return the value of pixel (r, c) in all frames"""
+        if self.is_provider:
+            if hasattr(self.source, 'get_pixel'):
+                return np.asarray(self.source.get_pixel(r, c))
+            d = np.full(self.num, np.nan)
+            with self.lock:
+                for i, frame in self.cache.items():
+                    d[i] = frame[r, c]
+            return d
+        return np.asarray(self.source[:, r, c])
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if isinstance(key[0], (int, np.integer)):
+            frame = self.get_frame(int(key[0]))
+            return frame[key[1:]] if len(key) > 1 else frame
+        if len(key) == 3 and key[0] == slice(None) and \
+                all(isinstance(k, (int, np.integer)) for k in key[1:]):
+            return self.get_pixel(int(key[1]), int(key[2]))
+        raise IndexError(f'Not supported index: {key}')
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            self.cache.clear()
+        if executor is not None:
+            executor.shutdown(wait=False)
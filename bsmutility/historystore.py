@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from collections.abc import Sequence
+from pathlib import Path
+import wx
+
+TIME_STAMP_HEADER = '#bsm#'
+
+class HistoryStore(Sequence):
+    """
+    The command history saved in an append-only journal file (one json record
+    per line), so adding a command only appends one line to the file instead
+    of rewriting the whole history.
+
+    The commands are grouped by day in memory. It can also be used as the
+    history list of wx.py.shell.Shell, i.e., history[0] is the newest command.
+    """
+
+    def __init__(self, filename, max_count=20000):
+        self.filename = filename
+        self.max_count = max_count
+        # [(day, command)], oldest first
+        self._items = []
+        # {day: [command]}, oldest first
+        self._days = {}
+        # number of records in the journal file
+        self._journal_count = 0
+        self._fp = None
+        self._lock = threading.Lock()
+        self._compactor = None
+        # records appended while compacting
+        self._pending = None
+        self._load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [c for _, c in reversed(self._items)][index]
+        n = len(self._items)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('history index out of range')
+        return self._items[n - 1 - index][1]
+
+    def GetDays(self):
+        """return all the days, oldest first"""
+        return sorted(self._days.keys())
+
+    def GetCommands(self, day):
+        """return the commands on day, oldest first"""
+        return list(self._days.get(day, []))
+
+    def Append(self, command, day=None):
+        if not day:
+            day = time.strftime('%Y/%m/%d')
+        self._append(day, command)
+        self._write(['a', day, command])
+        if len(self._items) > self.max_count * 1.1:
+            # trim in batch, so the cost is amortized
+            self._trim()
+
+    def Delete(self, day, command, index=None):
+        """
+        delete the command on day; index is its position in GetCommands(day),
+        the newest one is deleted if it is not available
+        """
+        index = self._delete(day, command, index)
+        if index is not None:
+            self._write(['d', day, command, index])
+
+    def DeleteDay(self, day):
+        if self._delete_day(day):
+            self._write(['dd', day])
+
+    def Clear(self):
+        self._items = []
+        self._days = {}
+        self._write(['c'])
+        self.Compact()
+
+    def SetMaxCount(self, max_count):
+        self.max_count = max(int(max_count), 1)
+        if len(self._items) > self.max_count:
+            self._trim()
+
+    def Import(self, history):
+        """
+        import the history list used by the previous version, i.e., the newest
+        command first, with '#bsm#YYYY/MM/DD' marker after the commands on
+        that day.
+        """
+        day = time.strftime('%Y/%m/%d')
+        records = []
+        for value in reversed(history):
+            if not isinstance(value, str):
+                continue
+            if value.startswith(TIME_STAMP_HEADER):
+                day = value[len(TIME_STAMP_HEADER):]
+                continue
+            self._append(day, value)
+            records.append(['a', day, value])
+        # journal the imported commands, so they are kept even if the
+        # compaction fails or is skipped
+        self._write_many(records)
+        self._trim()
+        self.Compact()
+
+    def Compact(self, wait=False):
+        """rewrite the journal file with the current history"""
+        with self._lock:
+            if self._pending is not None:
+                # already compacting
+                return
+            self._pending = []
+            snapshot = list(self._items)
+        self._compactor = threading.Thread(target=self._compact,
+                                           args=(snapshot,), daemon=True)
+        self._compactor.start()
+        if wait:
+            self.Wait()
+
+    def Wait(self):
+        """wait for the background compaction"""
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    def Flush(self):
+        with self._lock:
+            if self._fp is not None:
+                self._fp.flush()
+
+    def Close(self):
+        self.Wait()
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def _append(self, day, command):
+        self._items.append((day, command))
+        self._days.setdefault(day, []).append(command)
+
+    def _delete(self, day, command, index=None):
+        """delete the command, and return its index on day (None if not found)"""
+        commands = self._days.get(day, [])
+        if index is None or not 0 <= index < len(commands) or \
+                commands[index] != command:
+            # the newest one
+            for index in range(len(commands) - 1, -1, -1):
+                if commands[index] == command:
+                    break
+            else:
+                return None
+        # the same command may appear multiple times on day
+        occurrence = commands[:index].count(command)
+        del commands[index]
+        if not commands:
+            self._days.pop(day, None)
+        for i, item in enumerate(self._items):
+            if item == (day, command):
+                if occurrence == 0:
+                    del self._items[i]
+                    break
+                occurrence -= 1
+        return index
+
+    def _delete_day(self, day):
+        if self._days.pop(day, None) is None:
+            return False
+        self._items = [item for item in self._items if item[0] != day]
+        return True
+
+    def _trim(self):
+        if self._trim_to(self.max_count):
+            self._write(['t', self.max_count])
+            self.Compact()
+
+    def _trim_to(self, count):
+        """only keep the newest count commands"""
+        n = len(self._items) - count
+        if n <= 0:
+            return False
+        for day, _ in self._items[:n]:
+            commands = self._days[day]
+            commands.pop(0)
+            if not commands:
+                self._days.pop(day)
+        del self._items[:n]
+        return True
+
+    def _apply(self, record):
+        op = record[0]
+        if op == 'a':
+            self._append(record[1], record[2])
+        elif op == 'd':
+            self._delete(*record[1:4])
+        elif op == 'dd':
+            self._delete_day(record[1])
+        elif op == 't':
+            self._trim_to(record[1])
+        elif op == 'c':
+            self._items = []
+            self._days = {}
+
+    def _load(self):
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as fp:
+                for line in fp:
+                    self._journal_count += 1
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, IndexError, TypeError):
+                        # ignore the broken record (e.g., app crashed when
+                        # writing it)
+                        continue
+        except OSError:
+            traceback.print_exc(file=sys.stdout)
+            return
+        if len(self._items) > self.max_count:
+            self._trim()
+        elif self._journal_count > 2 * len(self._items) + 100:
+            self.Compact()
+
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.filename, 'a', encoding='utf-8')
+        return self._fp
+
+    def _write(self, record):
+        self._write_many([record])
+
+    def _write_many(self, records):
+        if not records:
+            return
+        lines = [json.dumps(record) + '\n' for record in records]
+        with self._lock:
+            try:
+                self._open().writelines(lines)
+                self._fp.flush()
+            except OSError:
+                traceback.print_exc(file=sys.stdout)
+                return
+            self._journal_count += len(lines)
+            if self._pending is not None:
+                self._pending.extend(lines)
+
+    def _compact(self, snapshot):
+        tmp = self.filename + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as fp:
+                for day, command in snapshot:
+                    fp.write(json.dumps(['a', day, command]) + '\n')
+        except OSError:
+            traceback.print_exc(file=sys.stdout)
+            with self._lock:
+                self._pending = None
+            return
+
+        with self._lock:
+            try:
+                # the records added after the snapshot
+                with open(tmp, 'a', encoding='utf-8') as fp:
+                    fp.writelines(self._pending)
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                if self._fp is not None:
+                    self._fp.close()
+                    self._fp = None
+                os.replace(tmp, self.filename)
+                self._journal_count = len(snapshot) + len(self._pending)
+            except OSError:
+                traceback.print_exc(file=sys.stdout)
+            self._pending = None
+
+
+_history_store = None
+
+def get_history_store(filename='shell_history.jsonl', foler='bsmutility'):
+    """return the history store shared by the shell and the history panel"""
+    global _history_store
+    if _history_store is None:
+        s = wx.StandardPaths.Get()
+        cfg = os.path.join(s.GetUserConfigDir(), foler)
+        Path(cfg).mkdir(parents=True, exist_ok=True)
+        _history_store = HistoryStore(os.path.join(cfg, filename))
+    return _history_store
@@ -8,18 +8,24 @@ import six
 import wx
 import wx.py.dispatcher as dp
 import wx.svg
+import wx.lib.mixins.listctrl as listmix
 import aui2 as aui
 from .dirtreectrl import DirListCtrl, EVT_DIR_OPEN, DirTreeCtrl, DirTreeList
 from .bsmxpm import backward_svg2, backward_gray_svg2, forward_svg2, \
                     forward_gray_svg2, up_svg, home_svg2, more_svg, refresh_svg, \
-                    files_svg, history_svg, help_svg
+                    files_svg, history_svg, help_svg, stop_svg, stop_grey_svg, \
+                    delete_svg, task_svg, speed_svg
 from .autocomplete import AutocompleteTextCtrl
 from .utility import FastLoadTreeCtrl, svg_to_bitmap, get_path_list, \
-                     unescape_path
+                     unescape_path, path_list_completion_count
 from .editor_base import EditorBase
+from .historystore import get_history_store, TIME_STAMP_HEADER
 from .bsminterface import InterfaceRename
 from .auipathbar import AuiPathBar, EVT_AUIPATHBAR_CLICK
 from .findmixin import FindTreeMixin
+from .shell_base import jobs, format_time
+from .findlistctrl import ListCtrlBase
+from .editor import Editor
 
 class HelpText(EditorBase):
 
@@ -217,7 +223,7 @@ class HistoryTreeCtrl(FastLoadTreeCtrl, FindTreeMixin):
 
 class HistoryPanel(wx.Panel):
     ID_EXECUTE = wx.NewIdRef()
-    TIME_STAMP_HEADER = "#bsm#"
+    TIME_STAMP_HEADER = TIME_STAMP_HEADER
 
     def __init__(self, parent):
         wx.Panel.__init__(self, parent)
@@ -332,21 +338,12 @@ class HistoryPanel(wx.Panel):
         return [h for h in history if h.startswith(self.TIME_STAMP_HEADER) or pattern.search(h) is not None]
 
     def LoadHistory(self):
-        resp = dp.send('frame.get_config', group='shell', key='history')
-        history = []
-        if resp and resp[0][1]:
-            history = resp[0][1]
-
-        history = self.filterHistory(history)
+        store = get_history_store()
         self.history = {}
-        stamp = time.strftime('%Y/%m/%d')
-        for i in six.moves.range(len(history) - 1, -1, -1):
-            value = history[i]
-            if value.startswith(self.TIME_STAMP_HEADER):
-                stamp = value[len(self.TIME_STAMP_HEADER):]
-                self.history[stamp] = self.history.get(stamp, [])
-            elif self.history.get(stamp, None) is not None:
-                self.history[stamp].append(value)
+        for stamp in store.GetDays():
+            commands = self.filterHistory(store.GetCommands(stamp))
+            if commands:
+                self.history[stamp] = commands
         self.tree.DeleteChildren(self.root)
         self.tree.FillChildren(self.root)
         item, _ = self.tree.GetFirstChild(self.root)
@@ -357,31 +354,11 @@ class HistoryPanel(wx.Panel):
                 self.tree.SelectItem(child)
                 self.tree.EnsureVisible(child)
 
-    def SaveHistory(self, config):
+    def SaveHistory(self, config=None):
         """save the history"""
-        config.DeleteGroup('/CommandHistory')
-        config.SetPath('/CommandHistory')
-        (item, cookie) = self.tree.GetFirstChild(self.root)
-        pos = 0
-        while item.IsOk():
-            stamp = self.tree.GetItemText(item)
-            config.Write("item%d" % pos, self.TIME_STAMP_HEADER + stamp)
-            pos += 1
-
-            childitem, childcookie = self.tree.GetFirstChild(item)
-            if childitem.IsOk() and self.tree.GetItemText(childitem) != "...":
-                while childitem.IsOk():
-                    config.Write("item%d" % pos,
-                                 self.tree.GetItemText(childitem))
-                    childitem, childcookie = self.tree.GetNextChild(
-                        item, childcookie)
-                    pos = pos + 1
-            # save the unexpanded folder
-            for child in self.history.get(stamp, []):
-                config.Write("item%d" % pos, child)
-                pos = pos + 1
-
-            (item, cookie) = self.tree.GetNextChild(self.root, cookie)
+        # the history is saved in the history store when it is added, just
+        # make sure it is written to disk
+        get_history_store().Flush()
 
     def AddHistory(self, command, stamp=""):
         """ add history to treectrl """
@@ -481,7 +458,13 @@ class HistoryPanel(wx.Panel):
                     if index > 0:
                         index = len(self.history[timestamp]) - index
                         assert self.history[timestamp][index] == cmd
+                        # the history may be filtered, find the same
+                        # occurrence in the history store
+                        occurrence = self.history[timestamp][:index].count(cmd)
                         del self.history[timestamp][index]
+                        commands = get_history_store().GetCommands(timestamp)
+                        matched = [i for i, c in enumerate(commands) if c == cmd]
+                        index = matched[occurrence] if occurrence < len(matched) else -1
                     timestamp = f"#bsm#{timestamp}"
                 else:
                     self.history.pop(cmd, None)
@@ -611,7 +594,8 @@ class DirPanel(wx.Panel):
     def completer(self, query):
 
         path, prefix = os.path.split(query)
-        k = get_path_list(path=path, prefix=prefix, files=False)
+        k = get_path_list(path=path, prefix=prefix, files=False,
+                          max_count=path_list_completion_count)
         return k, k, len(prefix)
 
     def OnOpenPath(self, event):
@@ -799,15 +783,258 @@ class DirPanel(wx.Panel):
         elif idx == wx.ID_BACKWARD:
             event.Enable(h_idx > 0)
 
+class JobListCtrl(wx.ListCtrl, listmix.ListCtrlAutoWidthMixin,
+                  listmix.ListRowHighlighter):
+    def __init__(self, *args, **kwargs):
+        wx.ListCtrl.__init__(self, *args, **kwargs)
+
+        listmix.ListCtrlAutoWidthMixin.__init__(self)
+        listmix.ListRowHighlighter.__init__(self, mode=listmix.HIGHLIGHT_ODD)
+        self.SetHighlightColor(wx.Colour(240, 240, 250))
+
+
+class JobsPanel(wx.Panel):
+    """show the background jobs (shell_base.jobs)"""
+
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent)
+
+        agwStyle = aui.AUI_TB_OVERFLOW
+        self.tb = aui.AuiToolBar(self, agwStyle=agwStyle)
+        self.tb.AddTool(wx.ID_STOP, 'Cancel',
+                        svg_to_bitmap(stop_svg, win=self),
+                        svg_to_bitmap(stop_grey_svg, win=self),
+                        aui.ITEM_NORMAL,
+                        'Cancel the selected jobs')
+        self.tb.AddTool(wx.ID_CLEAR, 'Clear',
+                        svg_to_bitmap(delete_svg, win=self),
+                        wx.NullBitmap,
+                        aui.ITEM_NORMAL,
+                        'Remove the finished jobs')
+        self.tb.Realize()
+
+        self.listctrl = JobListCtrl(self,
+                                    style=wx.LC_REPORT
+                                    | wx.BORDER_NONE
+                                    | wx.LC_VRULES
+                                    | wx.LC_HRULES)
+        self.listctrl.InsertColumn(0, '#')
+        self.listctrl.InsertColumn(1, 'Status')
+        self.listctrl.InsertColumn(2, 'Progress')
+        self.listctrl.InsertColumn(3, 'Elapsed')
+        self.listctrl.InsertColumn(4, 'Result')
+        self.listctrl.InsertColumn(5, 'Name')
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.tb, 0, wx.ALL | wx.EXPAND, 0)
+        sizer.Add(self.listctrl, 1, wx.ALL | wx.EXPAND, 0)
+        self.SetSizer(sizer)
+
+        self.Bind(wx.EVT_TOOL, self.OnCancel, id=wx.ID_STOP)
+        self.Bind(wx.EVT_TOOL, self.OnClear, id=wx.ID_CLEAR)
+        self.Bind(wx.EVT_UPDATE_UI, self.OnUpdateUI)
+        self.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnItemActivated, self.listctrl)
+        # refresh the progress/elapsed time of the running jobs
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+        dp.connect(self.OnJobsUpdated, 'jobs.updated')
+        self.UpdateJobs()
+
+    def Destroy(self):
+        self.timer.Stop()
+        dp.disconnect(self.OnJobsUpdated, 'jobs.updated')
+        super().Destroy()
+
+    def GetSelectedJobs(self):
+        ids = []
+        item = self.listctrl.GetFirstSelected()
+        while item != -1:
+            ids.append(self.listctrl.GetItemData(item))
+            item = self.listctrl.GetNextSelected(item)
+        return ids
+
+    def UpdateJobs(self):
+        selected = self.GetSelectedJobs()
+        all_jobs = list(jobs.jobs.values())
+        if self.listctrl.GetItemCount() != len(all_jobs):
+            self.listctrl.DeleteAllItems()
+            for job in all_jobs:
+                idx = self.listctrl.InsertItem(self.listctrl.GetItemCount(), str(job.id))
+                self.listctrl.SetItemData(idx, job.id)
+        for idx, job in enumerate(all_jobs):
+            progress = '' if job.progress is None else f'{job.progress*100:.0f}%'
+            values = [str(job.id), job.status, progress, f'{job.elapsed:.1f}s',
+                      job.result_name, job.name]
+            for col, v in enumerate(values):
+                if self.listctrl.GetItemText(idx, col) != v:
+                    self.listctrl.SetItem(idx, col, v)
+            self.listctrl.SetItemData(idx, job.id)
+            self.listctrl.Select(idx, job.id in selected)
+        if jobs.running():
+            if not self.timer.IsRunning():
+                self.timer.Start(500)
+        else:
+            self.timer.Stop()
+
+    def OnJobsUpdated(self, job):
+        self.UpdateJobs()
+
+    def OnTimer(self, event):
+        self.UpdateJobs()
+
+    def OnCancel(self, event):
+        for jid in self.GetSelectedJobs():
+            jobs.cancel(jid)
+
+    def OnClear(self, event):
+        jobs.clear()
+
+    def OnItemActivated(self, event):
+        # show the result in shell
+        job = jobs.jobs.get(self.listctrl.GetItemData(event.GetIndex()), None)
+        if job is not None and job.status == 'done':
+            dp.send('shell.run', command=job.result_name, prompt=True,
+                    verbose=True, history=False)
+
+    def OnUpdateUI(self, event):
+        eid = event.GetId()
+        if eid == wx.ID_STOP:
+            event.Enable(any(jobs.jobs[j].status in ('pending', 'running')
+                             for j in self.GetSelectedJobs() if j in jobs.jobs))
+        elif eid == wx.ID_CLEAR:
+            event.Enable(len(jobs.running()) < len(jobs))
+
+
+class ProfileListCtrl(ListCtrlBase):
+    """show the profile stats, one function per row"""
+    # sort key of pstats -> column
+    SORT_COLUMNS = {'ncalls': 1, 'calls': 1, 'tottime': 2, 'time': 2,
+                    'cumulative': 4, 'cumtime': 4}
+
+    def BuildColumns(self):
+        super().BuildColumns()
+        for name in ['ncalls', 'tottime', 'percall', 'cumtime', 'percall']:
+            self.AppendColumn(name, format=wx.LIST_FORMAT_RIGHT, width=80)
+        self.AppendColumn('filename:lineno(function)', width=400)
+
+    def Load(self, stats, sort='cumulative'):
+        """load the pstats.Stats"""
+        data = []
+        for (filename, lineno, func), (cc, nc, tt, ct, _) in stats.stats.items():
+            ncalls = str(nc) if nc == cc else f'{nc}/{cc}'
+            if filename == '~' and lineno == 0:
+                # built-in function
+                label = func
+            else:
+                label = f'{filename}:{lineno}({func})'
+            data.append((nc, tt, tt / nc if nc else 0, ct, ct / cc if cc else 0,
+                         label, filename, lineno, ncalls))
+        self.ShowSortIndicator(self.SORT_COLUMNS.get(sort, 4), False)
+        super().Load(data)
+
+    def OnGetItemText(self, item, column):
+        if column < self.data_start_column:
+            return super().OnGetItemText(item, column)
+        row = self.data_shown[item]
+        if column == 1:
+            return row[-1]
+        if column < 6:
+            return f'{row[column - 1]:.6f}'
+        return row[5]
+
+    def SortBy(self, column, ascending):
+        if column < self.data_start_column:
+            return
+        self.data.sort(key=lambda x: x[column - 1], reverse=not ascending)
+
+    def ApplyPattern(self):
+        if self.pattern:
+            self.data_shown = [d for d in self.data if self.pattern in d[5].lower()]
+        else:
+            self.data_shown = self.data
+
+    def FindText(self, start, end, text, flags=0):
+        direction = 1 if end > start else -1
+        for i in range(start, end+direction, direction):
+            if self.Search(self.data_shown[i][5], text, flags):
+                return i
+        # not found
+        return -1
+
+
+class ProfilePanel(wx.Panel):
+    """show the stats from %prun (shell_base.magic_prun)"""
+
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent)
+
+        self.label = wx.StaticText(self, label='')
+        self.search = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.search.ShowCancelButton(True)
+        self.search.SetDescriptiveText('Filter the functions')
+        self.listctrl = ProfileListCtrl(self)
+
+        sizer_top = wx.BoxSizer(wx.HORIZONTAL)
+        sizer_top.Add(self.label, 1, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        sizer_top.Add(self.search, 1, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 2)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(sizer_top, 0, wx.EXPAND, 0)
+        sizer.Add(self.listctrl, 1, wx.ALL | wx.EXPAND, 0)
+        self.SetSizer(sizer)
+
+        self.Bind(wx.EVT_TEXT, self.OnSearch, self.search)
+        self.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.OnSearchCancel, self.search)
+        self.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnItemActivated, self.listctrl)
+        dp.connect(self.OnShowStats, 'profile.show')
+
+    def Destroy(self):
+        dp.disconnect(self.OnShowStats, 'profile.show')
+        super().Destroy()
+
+    def OnShowStats(self, stats, title='', sort='cumulative'):
+        if not wx.IsMainThread():
+            # e.g., the command is running in a worker thread
+            wx.CallAfter(self.ShowStats, stats, title, sort)
+        else:
+            self.ShowStats(stats, title, sort)
+        return True
+
+    def ShowStats(self, stats, title='', sort='cumulative'):
+        self.label.SetLabel(f'{title}: {stats.total_calls} calls in '
+                            f'{format_time(stats.total_tt)}')
+        self.listctrl.Load(stats, sort)
+        if not self.IsShownOnScreen():
+            dp.send('frame.show_panel', panel=self)
+
+    def OnSearch(self, event):
+        self.listctrl.Fill(self.search.GetValue())
+
+    def OnSearchCancel(self, event):
+        self.search.SetValue('')
+
+    def OnItemActivated(self, event):
+        # open the source in editor
+        row = self.listctrl.data_shown[event.GetIndex()]
+        filename, lineno = row[6], row[7]
+        if not os.path.isfile(filename):
+            return
+        if Editor.frame is not None:
+            Editor.OpenScript(filename, lineno=lineno)
+        else:
+            dp.send('frame.file_drop', filename=filename, lineno=lineno)
+
+
 class MiscTools(InterfaceRename):
 
     panelHistory = None
     panelHelp = None
     panelDir = None
+    panelJobs = None
+    panelProfile = None
 
     @classmethod
     def initialize(cls, frame, history_panel=True, help_panel=True, dir_panel=True,
-                   **kwargs):
+                   jobs_panel=True, profile_panel=True, **kwargs):
         super().initialize(frame, **kwargs)
 
         active = kwargs.get('active', True)
@@ -863,11 +1090,48 @@ class MiscTools(InterfaceRename):
                                }
                     )
 
+        # background jobs panel
+        if jobs_panel:
+            cls.panelJobs = JobsPanel(frame)
+            bmp = svg_to_bitmap(task_svg, win=cls.panelJobs)
+            dp.send(signal='frame.add_panel',
+                    panel=cls.panelJobs,
+                    title="Jobs",
+                    target="History",
+                    showhidemenu='View:Panels:Background Jobs',
+                    active=False,
+                    direction=direction,
+                    name='jobs',
+                    icon=bmp,
+                    pane_menu={'rxsignal': 'misctool.pane_menu',
+                               'menu': [{'id':cls.ID_PANE_RENAME, 'label':'Rename'}]
+                               }
+                    )
+
+        # profile panel (%prun)
+        if profile_panel:
+            cls.panelProfile = ProfilePanel(frame)
+            bmp = svg_to_bitmap(speed_svg, win=cls.panelProfile)
+            dp.send(signal='frame.add_panel',
+                    panel=cls.panelProfile,
+                    title="Profile",
+                    target="History",
+                    showhidemenu='View:Panels:Profile',
+                    active=False,
+                    direction=direction,
+                    name='profile',
+                    icon=bmp,
+                    pane_menu={'rxsignal': 'misctool.pane_menu',
+                               'menu': [{'id':cls.ID_PANE_RENAME, 'label':'Rename'}]
+                               }
+                    )
+
         dp.connect(cls.PaneMenu, 'misctool.pane_menu')
 
     @classmethod
     def PaneMenu(cls, pane, command):
-        if not pane or pane.window not in [cls.panelHistory, cls.panelHelp, cls.panelDir]:
+        if not pane or pane.window not in [cls.panelHistory, cls.panelHelp, cls.panelDir,
+                                           cls.panelJobs, cls.panelProfile]:
             return
 
         if command == cls.ID_PANE_RENAME:
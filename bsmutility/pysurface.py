@@ -1,5 +1,7 @@
 import numpy as np
-from .surface import SurfacePanel, GLSurface
+from .surface import SurfacePanel, GLSurface, is_frame_source
+from .sharedframes import SharedFrameRing
+from .framesource import FrameSource
 
 def gcs():
     """
@@ -16,13 +18,17 @@ def gcs():
         return None
     return pane
 
-def surface(points=None, clear=True, num=None):
+def surface(points=None, clear=True, num=None, timestamps=None):
     """
     Create a new glsurface window, or activate an existing one.
 
     If points is not none, plot it in the glsurface window. If clear is True,
     reset the frame buffer of the glsurface window, otherwise add the points as
-    the new frame.
+    the new frame. timestamps (in second, one per frame) is optional, and used
+    to play the frames in real time.
+
+    points can also be a np.memmap (num x rows x cols) or a frame provider
+    (with __len__ and get_frame(i)), and the frames are loaded when shown.
     """
     if num is not None:
         pane = SurfacePanel.Gcc.get_manager(num)
@@ -31,9 +37,27 @@ def surface(points=None, clear=True, num=None):
     if pane is None:
         GLSurface.AddFigure(num=num)
     if pane is not None and points is not None:
-        if np.ndim(points) in (2, 3):
-            pane.plot(points, clear=clear)
+        if is_frame_source(points) or np.ndim(points) in (2, 3):
+            pane.plot(points, clear=clear, timestamps=timestamps)
         else:
             print("Error: unsupported data format")
 
     return pane
+
+def surface_shared(name, num=None):
+    """
+    Show the frames in the SharedFrameRing with name, which may be written by
+    another process, e.g.,
+
+        ring = SharedFrameRing.create((rows, cols), length=256)
+        ring.write(frame)
+    """
+    if num is not None:
+        pane = SurfacePanel.Gcc.get_manager(num)
+        if pane is None:
+            pane = GLSurface.AddFigure(num=num)
+    else:
+        pane = gcs()
+    if pane is not None:
+        pane.AttachSharedFrames(name)
+    return pane
@@ -7,11 +7,33 @@ def sind(a):
     return np.sin(np.deg2rad(a))
 
 class Quaternion:
+    '''
+    quaternion (or a series of quaternions), saved in a contiguous (N, 4)
+    array, each row is [w, x, y, z].
+    '''
     def __init__(self, w=0, x=0, y=0, z=0):
-        self.w = np.array(w)
-        self.x = np.array(x)
-        self.y = np.array(y)
-        self.z = np.array(z)
+        w, x, y, z = np.broadcast_arrays(w, x, y, z)
+        # scalar quaternion, return scalar from w/x/y/z, norm(), etc.
+        self._scalar = w.ndim == 0
+        self.q = np.empty((w.size, 4), dtype=np.result_type(w, x, y, z, float))
+        self.q[:, 0] = w.ravel()
+        self.q[:, 1] = x.ravel()
+        self.q[:, 2] = y.ravel()
+        self.q[:, 3] = z.ravel()
+
+    @classmethod
+    def from_array(cls, q, scalar=False):
+        '''constructor from (N, 4) or (4,) array, each row is [w, x, y, z];
+           the data is not copied if it is already a contiguous float array'''
+        q = np.asarray(q)
+        if q.shape[-1] != 4:
+            raise ValueError('Not supported array size')
+        obj = cls.__new__(cls)
+        obj._scalar = scalar or q.ndim == 1
+        if not np.issubdtype(q.dtype, np.floating):
+            q = q.astype(float)
+        obj.q = np.ascontiguousarray(q.reshape(-1, 4))
+        return obj
 
     @classmethod
     def from_list(cls, n):
@@ -28,46 +50,46 @@ class Quaternion:
 
     @classmethod
     def from_dcm(cls, m):
-        '''constructor from a dcm (Direction Cosine Matrix)'''
+        '''constructor from a dcm (Direction Cosine Matrix), (3, 3) or
+           (3, 3, N)'''
         # https://www.vectornav.com/resources/inertial-navigation-primer/math-fundamentals/math-attitudetran
         # https://d3cw3dd2w32x2b.cloudfront.net/wp-content/uploads/2015/01/matrix-to-quat.pdf
+        m = np.asarray(m)
         if len(m.shape) < 2:
             return None
         if m.shape[0] != 3 or m.shape[1] != 3:
             return None
-        N = 1
-        if len(m.shape) == 3:
-            N = m.shape[-1]
-        else:
+        scalar = len(m.shape) == 2
+        if scalar:
             m = m.reshape(3, 3, 1)
+        N = m.shape[-1]
         q = np.zeros((N, 4))
 
-        index = np.where(m[2,2] < 0 and m[0, 0] > m[1,1])
-        t = 1 + m[0, 0] - m[1,1] - m[2,2]
-        x, y, z, w = t, m[0,1]+m[1,0], m[2,0]+m[0,2], m[1,2]-m[2,1]
-        g = 0.5 / np.sqrt(t)
-        q[index, :] = np.vstack([w/g, x/g, y/g, z/g]).T
-
-        index = np.where(m[2,2] < 0 and m[0, 0] <= m[1,1])
-        t = 1 - m[0,0] + m[1,1] - m[2,2]
-        x, y, z, w = m[0,1]+m[1,0], t, m[1,2]+m[2,1], m[2,0]-m[0,2]
-        g = 0.5 / np.sqrt(t)
-        q[index, :] = np.vstack([w/g, x/g, y/g, z/g]).T
-
-        index = np.where(m[2,2] >= 0 and m[0, 0] < -m[1,1])
-        t = 1 - m[0,0] - m[1,1] + m[2,2]
-        x, y, z, w = m[2,0]+m[0,2], m[1,2]+m[2,1], t, m[0,1]-m[1,0]
-        g = 0.5 / np.sqrt(t)
-        q[index, :] = np.vstack([w/g, x/g, y/g, z/g]).T
-
-        index = np.where(m[2,2] >= 0 and m[0, 0] >= -m[1,1])
-        t = 1 + m[0,0] + m[1,1] + m[2,2]
-        x, y, z, w = m[1,2]-m[2,1], m[2,0]-m[0,2], m[0,1]-m[1,0], t
-        g = 0.5 / np.sqrt(t)
-        q[index, :] = np.vstack([w/g, x/g, y/g, z/g]).T
-
-        q = (q.T/np.linalg.norm(q,axis=1)).T
-        return Quaternion(q[:, 0], q[:, 1], q[:, 2], q[:, 3])
+        def _set(index, t, x, y, z, w):
+            g = 0.5 / np.sqrt(t[index])
+            q[index, 0] = w[index]*g
+            q[index, 1] = x[index]*g
+            q[index, 2] = y[index]*g
+            q[index, 3] = z[index]*g
+
+        index = (m[2, 2] < 0) & (m[0, 0] > m[1, 1])
+        t = 1 + m[0, 0] - m[1, 1] - m[2, 2]
+        _set(index, t, t, m[0, 1]+m[1, 0], m[2, 0]+m[0, 2], m[1, 2]-m[2, 1])
+
+        index = (m[2, 2] < 0) & (m[0, 0] <= m[1, 1])
+        t = 1 - m[0, 0] + m[1, 1] - m[2, 2]
+        _set(index, t, m[0, 1]+m[1, 0], t, m[1, 2]+m[2, 1], m[2, 0]-m[0, 2])
+
+        index = (m[2, 2] >= 0) & (m[0, 0] < -m[1, 1])
+        t = 1 - m[0, 0] - m[1, 1] + m[2, 2]
+        _set(index, t, m[2, 0]+m[0, 2], m[1, 2]+m[2, 1], t, m[0, 1]-m[1, 0])
+
+        index = (m[2, 2] >= 0) & (m[0, 0] >= -m[1, 1])
+        t = 1 + m[0, 0] + m[1, 1] + m[2, 2]
+        _set(index, t, m[1, 2]-m[2, 1], m[2, 0]-m[0, 2], m[0, 1]-m[1, 0], t)
+
+        q /= np.sqrt(np.einsum('ij,ij->i', q, q))[:, None]
+        return cls.from_array(q, scalar=scalar)
 
     @classmethod
     def from_angle(cls, yaw, pitch, roll):
@@ -81,12 +103,48 @@ class Quaternion:
         return Quaternion(w, x, y, z)
         #return cls.from_dcm(ang2dcm(yaw, pitch, roll, order='zyx'))
 
+    def _column(self, i):
+        if self._scalar:
+            return self.q[0, i]
+        return self.q[:, i]
+
+    @property
+    def w(self):
+        return self._column(0)
+
+    @property
+    def x(self):
+        return self._column(1)
+
+    @property
+    def y(self):
+        return self._column(2)
+
+    @property
+    def z(self):
+        return self._column(3)
+
     def __repr__(self):
         return f"w: {self.w} x: {self.x} y: {self.y} z: {self.z}"
 
-    def conj(self):
+    def __len__(self):
+        return self.q.shape[0]
+
+    def __getitem__(self, index):
+        '''return the quaternion(s) at index'''
+        q = self.q[index]
+        return Quaternion.from_array(q, scalar=q.ndim == 1)
+
+    def _new(self, q):
+        return Quaternion.from_array(q, scalar=self._scalar)
+
+    def conj(self, out=None):
         '''return conjugate'''
-        return Quaternion(self.w, -self.x, -self.y, -self.z)
+        if out is None:
+            out = np.empty_like(self.q)
+        np.negative(self.q, out=out)
+        out[:, 0] = self.q[:, 0]
+        return self._new(out)
 
     def to_list(self):
         '''return the list [w, x, y, z]'''
@@ -96,32 +154,60 @@ class Quaternion:
         '''return the np.array([w, x, y, z])'''
         return np.array(self.to_list())
 
+    def to_array(self):
+        '''return the (N, 4) array, each row is [w, x, y, z]'''
+        return self.q
+
     def to_tuple(self):
         '''return the tuple (w, x, y, z)'''
         return tuple(self.to_list())
 
-    def to_dcm(self):
-        '''return the rotation matrix'''
+    def to_dcm(self, out=None):
+        '''return the rotation matrix, (3, 3) or (3, 3, N)'''
         # https://www.vectornav.com/resources/inertial-navigation-primer/math-fundamentals/math-attitudetran
-        w, x, y, z = self.w, self.x, self.y, self.z
-        return np.array([[1-2*y**2-2*z**2, 2*x*y+2*w*z, 2*x*z-2*w*y],
-                         [2*x*y-2*w*z, 1-2*x**2-2*z**2, 2*y*z+2*w*x],
-                         [2*x*z+2*w*y, 2*y*z-2*w*x, 1-2*x**2-2*y**2],])
-
-    def to_angle(self):
-        '''return the rotation angle (yaw, pitch, roll), and the rotation is
-           equivalent to R_z(yaw)R_y(pitch)R_x(roll).'''
+        w, x, y, z = self.q[:, 0], self.q[:, 1], self.q[:, 2], self.q[:, 3]
+        if out is None:
+            out = np.empty((3, 3, len(self)))
+        m = out.reshape(3, 3, -1)
+        m[0, 0] = 1-2*(y*y+z*z)
+        m[0, 1] = 2*(x*y+w*z)
+        m[0, 2] = 2*(x*z-w*y)
+        m[1, 0] = 2*(x*y-w*z)
+        m[1, 1] = 1-2*(x*x+z*z)
+        m[1, 2] = 2*(y*z+w*x)
+        m[2, 0] = 2*(x*z+w*y)
+        m[2, 1] = 2*(y*z-w*x)
+        m[2, 2] = 1-2*(x*x+y*y)
+        if self._scalar:
+            return out.reshape(3, 3)
+        return out
+
+    def to_angle(self, out=None):
+        '''return the rotation angle (yaw, pitch, roll) in degree, and the
+           rotation is equivalent to R_z(yaw)R_y(pitch)R_x(roll).
+
+           out: optional (3, N) buffer for (yaw, pitch, roll)'''
         # way 1
         # m = self.to_dcm().transpose()
         # a1 = np.arctan2(m[2, 1], m[2, 2])
         # a2 = np.arctan2(-m[2, 0], np.sqrt(m[2, 1]**2+m[2,2]**2))
         # a3 = np.arctan2(m[1, 0], m[0, 0])
         #return np.array([a3, a2, a1])*180/np.pi
-        w, x, y, z = self.w, self.x, self.y, self.z
-        roll = np.arctan2(2*(w*x+y*z), 1-2*(x*x + y*y))
-        pitch = -np.pi/2 + 2*np.arctan2(np.sqrt(1+2*(w*y - x*z)), np.sqrt(1-2*(w*y - x*z)))
-        yaw = np.arctan2(2*(w*z + x*y), 1-2*(y*y+z*z))
-        return np.rad2deg(yaw), np.rad2deg(pitch), np.rad2deg(roll)
+        w, x, y, z = self.q[:, 0], self.q[:, 1], self.q[:, 2], self.q[:, 3]
+        if out is None:
+            out = np.empty((3, len(self)))
+        yaw, pitch, roll = out[0], out[1], out[2]
+        np.arctan2(2*(w*x+y*z), 1-2*(x*x + y*y), out=roll)
+        # clip to avoid nan from the rounding error
+        t = np.clip(2*(w*y - x*z), -1, 1)
+        np.arctan2(np.sqrt(1+t), np.sqrt(1-t), out=pitch)
+        pitch *= 2
+        pitch -= np.pi/2
+        np.arctan2(2*(w*z + x*y), 1-2*(y*y+z*z), out=yaw)
+        np.rad2deg(out, out=out)
+        if self._scalar:
+            return out[0, 0], out[1, 0], out[2, 0]
+        return yaw, pitch, roll
 
     def __add__(self, other):
         '''add two quaternion or a scale value.'''
@@ -129,32 +215,144 @@ class Quaternion:
         if isinstance(o, (int, float)):
             o = Quaternion(w=other, x=0, y=0, z=0)
         if isinstance(o, Quaternion):
-            return Quaternion(self.w+o.w, self.x+o.x, self.y+o.y, self.z+o.z)
+            return Quaternion.from_array(self.q + o.q,
+                                         scalar=self._scalar and o._scalar)
 
         raise ValueError('None supported data type')
 
     def __mul__(self, other):
         '''multiple by an quaternion or a scale value
            return self*other'''
-        o = other
-        if isinstance(o, (int, float)):
-            o = Quaternion(w=other, x=0, y=0, z=0)
-        if isinstance(o, Quaternion):
-            w = self.w*o.w - self.x*o.x - self.y * o.y - self.z*o.z
-            x = self.w*o.x + self.x*o.w + self.y * o.z - self.z*o.y
-            y = self.w*o.y - self.x*o.z + self.y * o.w + self.z*o.x
-            z = self.w*o.z + self.x*o.y - self.y * o.x + self.z*o.w
-            return Quaternion(w, x, y, z)
+        if isinstance(other, (int, float)):
+            return self._new(self.q * other)
+        if isinstance(other, Quaternion):
+            return self.multiply(other)
 
         raise ValueError('None supported data type')
 
+    def multiply(self, other, out=None):
+        '''return self*other (Hamilton product, row by row)'''
+        a, b = self.q, other.q
+        N = max(a.shape[0], b.shape[0])
+        if out is None:
+            out = np.empty((N, 4), dtype=np.result_type(a, b))
+        w1, x1, y1, z1 = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+        w2, x2, y2, z2 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+        out[:, 0] = w1*w2 - x1*x2 - y1*y2 - z1*z2
+        out[:, 1] = w1*x2 + x1*w2 + y1*z2 - z1*y2
+        out[:, 2] = w1*y2 - x1*z2 + y1*w2 + z1*x2
+        out[:, 3] = w1*z2 + x1*y2 - y1*x2 + z1*w2
+        return Quaternion.from_array(out, scalar=self._scalar and other._scalar)
+
+    def rotate(self, vectors, out=None):
+        '''rotate the (N, 3) or (3,) vectors by the quaternion(s) row by row,
+           i.e., q*v*q^-1, equivalent to to_dcm().T @ v but without building
+           the matrices'''
+        v = np.asarray(vectors, dtype=float)
+        scalar = self._scalar and v.ndim == 1
+        v = v.reshape(-1, 3)
+        q = self.q
+        w, u = q[:, :1], q[:, 1:]
+        # v' = v + 2/|q|^2*(w*(u x v) + u x (u x v))
+        s = 2/np.einsum('ij,ij->i', q, q)[:, None]
+        t = np.cross(u, v)
+        t *= s
+        if out is None:
+            out = np.empty((max(len(q), len(v)), 3))
+        np.add(v, w*t, out=out)
+        out += np.cross(u, t)
+        if scalar:
+            return out[0]
+        return out
+
     def norm(self):
-        return np.linalg.norm(self.to_numpy())
+        '''return the norm of each quaternion'''
+        n = np.sqrt(np.einsum('ij,ij->i', self.q, self.q))
+        if self._scalar:
+            return n[0]
+        return n
 
-    def normalize(self):
-        return self*(1/self.norm())
+    def normalize(self, out=None):
+        '''return the unit quaternion(s)'''
+        n = np.sqrt(np.einsum('ij,ij->i', self.q, self.q))
+        if out is None:
+            out = np.empty_like(self.q)
+        np.divide(self.q, n[:, None], out=out)
+        return self._new(out)
 
-    def inv(self):
-        if self.norm() == 0:
+    def inv(self, out=None):
+        '''return the inverse; for the quaternion with zero norm, return None
+           for scalar quaternion, or nan for the series'''
+        n2 = np.einsum('ij,ij->i', self.q, self.q)
+        if self._scalar and n2[0] == 0:
             return None
-        return self.conj()*(1/self.norm()**2)
+        c = self.conj(out=out).q
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c /= n2[:, None]
+        c[n2 == 0] = np.nan
+        return self._new(c)
+
+    def slerp(self, other, h, method='slerp'):
+        '''interpolate from self (h=0) to other (h=1) row by row, with the
+           shorter path. method: 'slerp' or 'nlerp' (normalized linear
+           interpolation, faster and close to slerp for small angle)'''
+        q0, q1 = self.q, other.q
+        h = np.asarray(h, dtype=float).reshape(-1, 1)
+        d = np.einsum('ij,ij->i', q0, q1)
+        # q and -q are the same rotation, flip to interpolate the shorter path
+        q1 = np.where(d[:, None] < 0, -q1, q1)
+        d = np.abs(d)
+        w0, w1 = 1 - h, h
+        if method == 'slerp':
+            theta = np.arccos(np.clip(d, -1, 1))[:, None]
+            s = np.sin(theta)
+            # fallback to nlerp when the angle is too small
+            big = s[:, 0] > 1e-6
+            if np.any(big):
+                w0 = np.broadcast_to(w0, s.shape).copy()
+                w1 = np.broadcast_to(w1, s.shape).copy()
+                w0[big] = np.sin(w0[big]*theta[big])/s[big]
+                w1[big] = np.sin(w1[big]*theta[big])/s[big]
+        elif method != 'nlerp':
+            raise ValueError(f'Not supported method: {method}')
+        q = w0*q0 + w1*q1
+        q /= np.sqrt(np.einsum('ij,ij->i', q, q))[:, None]
+        return Quaternion.from_array(q, scalar=self._scalar and other._scalar)
+
+    def resample(self, t, t_new, method='slerp'):
+        '''resample the quaternion series at timestamp t to timestamp t_new;
+           the values beyond t are clamped to the first/last quaternion;
+           t/t_new may be numbers, or datetime64/timedelta64'''
+        t, t_new = np.asarray(t).ravel(), np.asarray(t_new).ravel()
+        if t.dtype.kind in 'mM' or t_new.dtype.kind in 'mM':
+            # float seconds relative to a common origin, so the precision is
+            # kept (e.g., nanoseconds since epoch)
+            origin = t.min() if len(t) else t_new.min()
+            t = (t - origin) / np.timedelta64(1, 's')
+            t_new = (t_new - origin) / np.timedelta64(1, 's')
+        t = t.astype(float)
+        t_new = t_new.astype(float)
+        if len(t) != len(self):
+            raise ValueError('The timestamp has different length')
+        q = self.q
+        if len(t) > 1 and np.any(np.diff(t) < 0):
+            idx = np.argsort(t, kind='stable')
+            t, q = t[idx], q[idx]
+        if len(t) == 1:
+            return Quaternion.from_array(np.repeat(q, len(t_new), axis=0))
+
+        # hemisphere continuity, i.e., flip the sign so the neighbour
+        # quaternions are in the same hemisphere
+        d = np.einsum('ij,ij->i', q[1:], q[:-1])
+        sign = np.cumprod(np.where(d < 0, -1.0, 1.0))
+        q = q.copy()
+        q[1:] *= sign[:, None]
+
+        i = np.clip(np.searchsorted(t, t_new, side='right') - 1, 0, len(t) - 2)
+        dt = t[i+1] - t[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h = np.where(dt > 0, (t_new - t[i])/dt, 0)
+        h = np.clip(h, 0, 1)
+        q0 = Quaternion.from_array(q[i])
+        q1 = Quaternion.from_array(q[i+1])
+        return q0.slerp(q1, h, method=method)
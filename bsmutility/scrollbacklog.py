@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import traceback
+from pathlib import Path
+import wx
+
+class ScrollbackLog:
+    """
+    The rotating log file to save the text trimmed from the shell, i.e.,
+    shell_scrollback.log is the newest, then shell_scrollback.log.1, ...
+    """
+    def __init__(self, filename, max_bytes=10*1024*1024, backup_count=3):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def write(self, text):
+        try:
+            with open(self.filename, 'a', encoding='utf-8', newline='') as fp:
+                fp.write(text)
+                size = fp.tell()
+            if size > self.max_bytes:
+                self.rotate()
+        except OSError:
+            traceback.print_exc(file=sys.stdout)
+
+    def rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f'{self.filename}.{i}'
+            if os.path.isfile(src):
+                os.replace(src, f'{self.filename}.{i+1}')
+        if self.backup_count > 0:
+            os.replace(self.filename, f'{self.filename}.1')
+        else:
+            os.remove(self.filename)
+
+    def files(self):
+        """return the log files, the oldest first"""
+        files = [f'{self.filename}.{i}' for i in range(self.backup_count, 0, -1)]
+        files.append(self.filename)
+        return [f for f in files if os.path.isfile(f)]
+
+    def search(self, pattern, regex=False, ignore_case=True):
+        """return the matched lines [(filename, lineno, line)]"""
+        flags = re.IGNORECASE if ignore_case else 0
+        if not regex:
+            pattern = re.escape(pattern)
+        pattern = re.compile(pattern, flags)
+        matches = []
+        for filename in self.files():
+            with open(filename, 'r', encoding='utf-8', errors='replace') as fp:
+                for lineno, line in enumerate(fp, 1):
+                    if pattern.search(line):
+                        matches.append((filename, lineno, line.rstrip('\r\n')))
+        return matches
+
+
+def get_scrollback_log(filename='shell_scrollback.log', folder='bsmutility'):
+    s = wx.StandardPaths.Get()
+    cfg = os.path.join(s.GetUserConfigDir(), folder)
+    Path(cfg).mkdir(parents=True, exist_ok=True)
+    return ScrollbackLog(os.path.join(cfg, filename))
@@ -0,0 +1,123 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedFrameRing:
+    """
+    A ring of fixed-shape frames in shared memory, so a producer in another
+    process (e.g., a simulator) can feed the frames to the glsurface window
+    without pickling/copying them.
+
+    The producer creates the ring and writes the frames,
+        ring = SharedFrameRing.create((rows, cols), length=256)
+        ring.write(frame)
+
+    and the consumer attaches to it by name,
+        ring = SharedFrameRing.attach(ring.name)
+
+    The memory layout is
+        header (int64[8]): magic, rows, cols, length, dtype, sequence
+        timestamps (float64[length])
+        frames (dtype[length, rows, cols])
+
+    The sequence is the total number of frames written, and the latest frame
+    is at (sequence - 1) % length. It is updated after the frame is written,
+    so the consumer can read the frames up to sequence - 1 (as long as the
+    producer doesn't overwrite them in the meantime).
+    """
+    MAGIC = 0x42534d46
+    HEADER_SIZE = 64
+    SEQUENCE = 5
+    # the rings created by this process
+    _created = set()
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+        if self.header[0] != self.MAGIC:
+            raise ValueError(f'Invalid shared frame ring: {shm.name}')
+        rows, cols, length, dtype = (int(v) for v in self.header[1:5])
+        self.shape = (rows, cols)
+        self.length = length
+        self.dtype = np.dtype(chr(dtype))
+        offset = self.HEADER_SIZE
+        self.timestamps = np.ndarray((length,), dtype=np.float64,
+                                     buffer=shm.buf, offset=offset)
+        offset += self._align(length * 8)
+        self.frames = np.ndarray((length, rows, cols), dtype=self.dtype,
+                                 buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def _align(size, alignment=64):
+        return (size + alignment - 1) // alignment * alignment
+
+    @classmethod
+    def create(cls, shape, length=256, dtype=np.float64, name=None):
+        """create the ring (producer)"""
+        rows, cols = shape
+        dtype = np.dtype(dtype)
+        size = cls.HEADER_SIZE + cls._align(length * 8) + length * rows * cols * dtype.itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+        header[:] = [cls.MAGIC, rows, cols, length, ord(dtype.char), 0, 0, 0]
+        ring = cls(shm, owner=True)
+        ring.timestamps[:] = np.nan
+        cls._created.add(shm.name)
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """attach to an existing ring (consumer)"""
+        try:
+            # the consumer shall not unlink the memory when it exits
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13
+            shm = shared_memory.SharedMemory(name=name)
+            if shm.name not in cls._created:
+                try:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+                except Exception:
+                    pass
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def sequence(self):
+        return int(self.header[self.SEQUENCE])
+
+    def write(self, frame, timestamp=None):
+        """write one frame"""
+        seq = self.sequence
+        idx = seq % self.length
+        self.frames[idx] = frame
+        self.timestamps[idx] = time.time() if timestamp is None else timestamp
+        self.header[self.SEQUENCE] = seq + 1
+
+    def write_frames(self, frames, timestamps=None):
+        """write frames (num x rows x cols)"""
+        num = len(frames)
+        if timestamps is None:
+            timestamps = np.full(num, time.time())
+        seq = self.sequence
+        # only the newest length frames are kept
+        skip = max(num - self.length, 0)
+        idx = (seq + np.arange(skip, num)) % self.length
+        self.frames[idx] = frames[skip:]
+        self.timestamps[idx] = np.asarray(timestamps)[skip:]
+        self.header[self.SEQUENCE] = seq + num
+
+    def close(self):
+        # release the numpy views before closing the memory
+        self.header = self.timestamps = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        """remove the shared memory (producer)"""
+        self.shm.unlink()
+        type(self)._created.discard(self.shm.name)
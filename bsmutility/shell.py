@@ -5,6 +5,8 @@ import traceback
 import time
 import pydoc
 import shlex
+import threading
+import ctypes
 import six.moves.builtins as __builtin__
 import six
 import wx
@@ -15,8 +17,12 @@ from wx.py.pseudo import PseudoFile
 from .debugger import EngineDebugger
 from .editor_base import EditorThemeMixin
 from .findmixin import FindEditorMixin
-from .shell_base import magic, aliasDict, sx, ls, cd, pwd, unescape_path
-from .utility import get_path_list
+from .shell_base import magic, aliasDict, sx, ls, cd, pwd, jobs, unescape_path, \
+                         magic_time, magic_timeit, magic_prun, SxProcess
+from .utility import get_path_list, path_list_completion_count
+from .historystore import HistoryStore, get_history_store, TIME_STAMP_HEADER
+from .scrollbacklog import get_scrollback_log
+from .completion import CompletionCache
 
 
 # in linux, the multiprocessing/process.py/_bootstrap will call
@@ -50,6 +56,9 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
     ID_COPY_PLUS = wx.NewIdRef()
     ID_PASTE_PLUS = wx.NewIdRef()
     ID_WRAP_MODE = wx.NewIdRef()
+    ID_FAST_OUTPUT = wx.NewIdRef()
+    ID_SCROLLBACK_LOG = wx.NewIdRef()
+    ID_RUN_IN_THREAD = wx.NewIdRef()
 
     def __init__(self,
                  parent,
@@ -68,6 +77,28 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         # wx.py.shell.Shell.__init__ when execStartupScript is True
         self.enable_debugger = False
         self.silent = True
+        # the output is buffered, and written to the shell in chunks at most
+        # once every output_interval seconds
+        self.output_buffer = []
+        self.output_lock = threading.Lock()
+        self.output_last_flush = 0
+        self.output_interval = 0.1
+        # fast output: insert the text directly, without caret/undo/autocomp
+        # bookkeeping
+        self.fast_output = False
+        # the max number of lines/bytes kept in the shell (0 for no limit),
+        # the older text is trimmed, and optionally saved to a log file
+        self.scrollback_lines = 100000
+        self.scrollback_bytes = 0
+        self.scrollback_log = None
+        # run the command in a worker thread, so the UI is still responsive
+        self.run_in_thread = False
+        self.worker = None
+        # the commands (e.g., from editor) and the namespace updates received
+        # when the worker is running, i.e., [(func, args)]
+        self.command_queue = []
+        # the auto-completion list of the objects in the namespace
+        self.completion = CompletionCache()
         pyshell.Shell.__init__(self, parent, id, pos, size, style, introText,
                                locals, InterpClass, startupScript,
                                execStartupScript, useStockId=False, *args, **kwds)
@@ -87,6 +118,10 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         __builtin__.ls = ls
         __builtin__.cd = cd
         __builtin__.pwd = pwd
+        __builtin__.jobs = jobs
+        __builtin__.magic_time = magic_time
+        __builtin__.magic_timeit = magic_timeit
+        __builtin__.magic_prun = magic_prun
         self.callTipInsert = False
         self.searchHistory = True
         self.silent = False
@@ -99,6 +134,12 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         self.Bind(stc.EVT_STC_DO_DROP, self.OnDoDrop)
         self.Bind(stc.EVT_STC_START_DRAG, self.OnStartDrag)
         self.Bind(wx.EVT_MENU, self.OnWrapMode, self.ID_WRAP_MODE)
+        self.Bind(wx.EVT_MENU, self.OnFastOutput, self.ID_FAST_OUTPUT)
+        self.Bind(wx.EVT_MENU, self.OnScrollbackLog, self.ID_SCROLLBACK_LOG)
+        self.Bind(wx.EVT_MENU, self.OnRunInThread, self.ID_RUN_IN_THREAD)
+        self.interp.runcode = self.runcode
+        self.output_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnOutputTimer, self.output_timer)
 
         self.interp.locals['clear'] = self.clear
         self.interp.locals['help'] = _help
@@ -107,6 +148,7 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         self.interp.locals['off'] = False
         self.interp.locals['shell'] = self
         self.interp.locals['setting'] = self.setting
+        self.interp.locals['search_log'] = self.SearchLog
 
         dp.connect(self.writeOut, 'shell.write_out')
         dp.connect(self.runCommand, 'shell.run')
@@ -153,10 +195,24 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         return self.interp.locals
 
     def OnUpdateLocals(self, signal, sender, **kwargs):
-        return self.interp.locals.update(kwargs)
+        if self.IsWorkerRunning():
+            # the command is running in the same namespace, update it after
+            # the command is done
+            self.command_queue.append((self.UpdateLocals, (kwargs,)))
+            return
+        self.UpdateLocals(kwargs)
+
+    def UpdateLocals(self, values):
+        self.interp.locals.update(values)
+        self.completion.invalidate(self.interp.locals)
 
     def SetConfig(self):
-        dp.send('frame.set_config', group='shell', wrap=self.GetWrapMode() != wx.stc.STC_WRAP_NONE)
+        dp.send('frame.set_config', group='shell', wrap=self.GetWrapMode() != wx.stc.STC_WRAP_NONE,
+                fast_output=self.fast_output,
+                scrollback_lines=self.scrollback_lines,
+                scrollback_bytes=self.scrollback_bytes,
+                scrollback_log=self.scrollback_log is not None,
+                run_in_thread=self.run_in_thread)
 
     def LoadConfig(self):
         resp = dp.send('frame.get_config', group='shell', key='wrap')
@@ -165,6 +221,82 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
                 self.SetWrapMode(wx.stc.STC_WRAP_WORD)
             else:
                 self.SetWrapMode(wx.stc.STC_WRAP_NONE)
+        resp = dp.send('frame.get_config', group='shell', key='fast_output')
+        if resp and resp[0][1] is not None:
+            self.fast_output = bool(resp[0][1])
+        resp = dp.send('frame.get_config', group='shell', key='output_interval')
+        if resp and resp[0][1] is not None:
+            # in ms
+            self.output_interval = max(resp[0][1], 1) / 1000
+        lines, size, log = self.scrollback_lines, self.scrollback_bytes, False
+        resp = dp.send('frame.get_config', group='shell', key='scrollback_lines')
+        if resp and resp[0][1] is not None:
+            lines = resp[0][1]
+        resp = dp.send('frame.get_config', group='shell', key='scrollback_bytes')
+        if resp and resp[0][1] is not None:
+            size = resp[0][1]
+        resp = dp.send('frame.get_config', group='shell', key='scrollback_log')
+        if resp and resp[0][1] is not None:
+            log = resp[0][1]
+        self.SetScrollback(lines, size, log)
+        resp = dp.send('frame.get_config', group='shell', key='run_in_thread')
+        if resp and resp[0][1] is not None:
+            self.run_in_thread = bool(resp[0][1])
+
+    def SetScrollback(self, lines=None, size=None, log=None):
+        """
+        set the max number of lines and bytes kept in the shell (0 for no
+        limit); if log is True, the trimmed text is saved to a rotating log file
+        """
+        if lines is not None:
+            self.scrollback_lines = max(int(lines), 0)
+        if size is not None:
+            self.scrollback_bytes = max(int(size), 0)
+        if log is not None:
+            if not log:
+                self.scrollback_log = None
+            elif self.scrollback_log is None:
+                self.scrollback_log = get_scrollback_log()
+        self.TrimScrollback()
+
+    def TrimScrollback(self):
+        """trim the oldest output if it is longer than the scrollback limit"""
+        end = 0
+        lines = self.scrollback_lines
+        # trim in batch (10% more than the limit), so the cost is amortized
+        if lines and self.GetLineCount() > lines * 1.1:
+            end = self.PositionFromLine(self.GetLineCount() - lines)
+        size = self.scrollback_bytes
+        if size and self.GetTextLength() > size * 1.1:
+            line = self.LineFromPosition(self.GetTextLength() - size)
+            end = max(end, self.PositionFromLine(line + 1))
+        if self.waiting:
+            # the command is running, keep the last (incomplete) line
+            end = min(end, self.PositionFromLine(self.GetLineCount() - 1))
+        else:
+            # not trim the current prompt and command
+            end = min(end, self.PositionFromLine(self.LineFromPosition(self.promptPosStart)))
+        if end <= 0:
+            return
+        if self.scrollback_log is not None:
+            self.scrollback_log.write(self.GetTextRange(0, end))
+        self.SetUndoCollection(False)
+        self.DeleteRange(0, end)
+        self.SetUndoCollection(True)
+        self.EmptyUndoBuffer()
+        # the prompt of the running command may be trimmed, it will be reset
+        # when the command is done
+        self.promptPosStart = max(self.promptPosStart - end, 0)
+        self.promptPosEnd = max(self.promptPosEnd - end, 0)
+
+    def SearchLog(self, pattern, regex=False):
+        """search the output trimmed from the shell"""
+        if self.scrollback_log is None:
+            print('The scrollback log is off')
+            return
+        for filename, lineno, line in self.scrollback_log.search(pattern, regex=regex):
+            # double click to open the log file
+            print(f'File "{filename}", line {lineno}: {line}')
 
     def setting(self, *args, **kwargs):
         try:
@@ -189,6 +321,8 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
     def OnCtrlC(self, event):
         if self.CanCopy():
             self.Copy()
+        elif self.IsWorkerRunning():
+            self.InterruptWorker()
         else:
             self.interp.more = False
             endpos = self.GetTextLength()
@@ -196,9 +330,11 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             self.push('', history=False)
 
     def Destroy(self):
+        self.output_timer.Stop()
+        jobs.shutdown()
         self.debugger.release()
-        # save command history
-        dp.send('frame.set_config', group='shell', history=self.history)
+        # the command history is saved in the history store
+        self.history.Flush()
         dp.send('frame.set_config', group='shell', alias=aliasDict)
         dp.send('frame.set_config', group='shell', zoom=self.GetZoom())
 
@@ -219,6 +355,15 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
 
     def OnFrameClosing(self, event):
         """the frame is exiting"""
+        if self.IsWorkerRunning() and event.CanVeto():
+            msg = 'A command is running.\n Stop it (Ctrl+C) first!'
+            title = self.GetTopLevelParent().GetLabel()
+            dlg = wx.MessageDialog(self.GetTopLevelParent(), msg, title,
+                                   wx.OK)
+            dlg.ShowModal()
+            dlg.Destroy()
+            event.Veto()
+            return
         if self.IsDebuggerOn() and event.CanVeto():
             # stop closing if the debugger is running, otherwise it may crash
             # as some events (e.g., ID_DEBUG_SCRIPT in editor) may be
@@ -231,36 +376,6 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             dlg.Destroy()
             event.Veto()
 
-    def evaluate(self, word):
-        if word in six.iterkeys(self.interp.locals):
-            return self.interp.locals[word]
-        try:
-            self.interp.locals[word] = eval(word, self.interp.locals)
-            return self.interp.locals[word]
-        except:
-            try:
-                getattr(self, 'AutoCompleteIgnore').index(word)
-                return None
-            except:
-                try:
-                    components = word.split('.')
-                    try:
-                        mod = __import__(word)
-                    except:
-                        if len(components) < 2:
-                            return None
-                        mod = '.'.join(components[:-1])
-                        try:
-                            mod = __import__(mod)
-                        except:
-                            return None
-                    for comp in components[1:]:
-                        mod = getattr(mod, comp)
-                    self.interp.locals[word] = mod
-                    return mod
-                except:
-                    return None
-
     def Paste(self):
         """Replace selection with clipboard contents."""
         if self.CanPaste() and wx.TheClipboard.Open():
@@ -301,12 +416,8 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         # remove additional key from wx.py.dispatcher.send
         kwds.pop('sender', None)
         kwds.pop('signal', None)
-        try:
-            cmd = wx.py.introspect.getRoot(command, '.')
-            self.evaluate(cmd)
-        except:
-            pass
-        cmp = self.interp.getAutoCompleteList(command, *args, **kwds)
+        root = wx.py.introspect.getRoot(command, '.')
+        cmp = self.completion.get(root, self.interp.locals, *args, **kwds)
         part = command[command.rfind('.') + 1:]
         if part:
             part = part.lower()
@@ -328,11 +439,17 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
                 if not (c.isalnum() or c in ('_', '.')):
                     command = command[-i:]
                     break
-            cmd = wx.py.introspect.getRoot(command, '.')
-            self.evaluate(cmd)
         except:
             pass
-        super().autoCompleteShow(command, offset)
+        self.AutoCompSetAutoHide(self.autoCompleteAutoHide)
+        self.AutoCompSetIgnoreCase(self.autoCompleteCaseInsensitive)
+        root = wx.py.introspect.getRoot(command, '.')
+        cmp = self.completion.get(root, self.interp.locals,
+                                  includeMagic=self.autoCompleteIncludeMagic,
+                                  includeSingle=self.autoCompleteIncludeSingle,
+                                  includeDouble=self.autoCompleteIncludeDouble)
+        if cmp:
+            self.AutoCompShow(offset, ' '.join(cmp))
 
     def IsDebuggerOn(self):
         """check if the debugger is on"""
@@ -350,10 +467,17 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             self.SetAnchor(from_)
 
     def LoadHistory(self):
-        self.clearHistory()
-        resp = dp.send('frame.get_config', group='shell', key='history')
+        self.history = get_history_store()
+        self.historyIndex = -1
+        resp = dp.send('frame.get_config', group='shell', key='history_max_count')
         if resp and resp[0][1]:
-            self.history = resp[0][1]
+            self.history.SetMaxCount(resp[0][1])
+        if len(self.history) == 0:
+            # import the history saved in the config by the previous version
+            resp = dp.send('frame.get_config', group='shell', key='history')
+            if resp and resp[0][1]:
+                self.history.Import(resp[0][1])
+                dp.send('frame.set_config', group='shell', history=[])
         resp = dp.send('frame.get_config', group='shell', key='alias')
         if resp and resp[0][1]:
             aliasDict.update(resp[0][1])
@@ -412,6 +536,12 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         menu.AppendSeparator()
         menu.AppendCheckItem(self.ID_WRAP_MODE, 'Word wrap')
         menu.Check(self.ID_WRAP_MODE, self.GetWrapMode() != wx.stc.STC_WRAP_NONE)
+        menu.AppendCheckItem(self.ID_FAST_OUTPUT, 'Fast output')
+        menu.Check(self.ID_FAST_OUTPUT, self.fast_output)
+        menu.AppendCheckItem(self.ID_SCROLLBACK_LOG, 'Save trimmed output to log')
+        menu.Check(self.ID_SCROLLBACK_LOG, self.scrollback_log is not None)
+        menu.AppendCheckItem(self.ID_RUN_IN_THREAD, 'Run commands in background thread')
+        menu.Check(self.ID_RUN_IN_THREAD, self.run_in_thread)
         return menu
 
     def OnWrapMode(self, event):
@@ -421,6 +551,19 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             self.SetWrapMode(wx.stc.STC_WRAP_NONE)
         self.SetConfig()
 
+    def OnFastOutput(self, event):
+        self.FlushOutput()
+        self.fast_output = not self.fast_output
+        self.SetConfig()
+
+    def OnScrollbackLog(self, event):
+        self.SetScrollback(log=self.scrollback_log is None)
+        self.SetConfig()
+
+    def OnRunInThread(self, event):
+        self.run_in_thread = not self.run_in_thread
+        self.SetConfig()
+
     def OnKeyDown(self, event):
         """Key down event handler."""
         key = event.GetKeyCode()
@@ -429,6 +572,15 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             event.Skip()
             return
 
+        if self.IsWorkerRunning() and not self.reader.isreading:
+            # the command is running, not allow editing (except the input)
+            if key in (wx.WXK_RETURN, wx.WXK_NUMPAD_ENTER, wx.WXK_BACK,
+                       wx.WXK_DELETE, wx.WXK_TAB) or \
+               (key < 256 and not event.ControlDown() and not event.AltDown()):
+                return
+            event.Skip()
+            return
+
         shiftDown = event.ShiftDown()
         controlDown = event.ControlDown()
         rawControlDown = event.RawControlDown()
@@ -472,10 +624,12 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
                     prefix = unescape_path(prefix)
                     path, prefix = os.path.split(prefix)
                     if cmd_main in ['cd', '!cd', '!rmdir', '!mkdir']:
-                        k = get_path_list(path=path, prefix=prefix, files=False)
+                        k = get_path_list(path=path, prefix=prefix, files=False,
+                                          max_count=path_list_completion_count)
                     elif cmd_main in ['ls', '!ls', '!less', '!more', '!cp', '!mv',\
                                       '!rm', '!gvim']:
-                        k = get_path_list(path=path, prefix=prefix)
+                        k = get_path_list(path=path, prefix=prefix,
+                                          max_count=path_list_completion_count)
                     lengthEntered = len(prefix)
                     if ' ' in prefix:
                         if wx.Platform == '__WXMSW__':
@@ -587,70 +741,161 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
     def writeOut(self, text):
         """Replacement for stdout."""
         # only output the text when it is not silent
+        if self.silent:
+            if self.stdout:
+                print(text, file=self.stdout)
+            return
+        # buffer the text, so printing lots of short text will not update the
+        # shell every time
+        with self.output_lock:
+            self.output_buffer.append(text)
+        if not wx.IsMainThread():
+            # not touch the window from other thread, flush it in idle event
+            wx.WakeUpIdle()
+        elif time.time() - self.output_last_flush >= self.output_interval:
+            self.FlushOutput()
+        elif self.waiting:
+            # the command is blocking the main thread, so the timer will not
+            # be fired until it is done; the text will be flushed by the next
+            # write after the interval, or when the statement is done (see
+            # push_multiple_line)
+            pass
+        elif not self.output_timer.IsRunning():
+            # not use wx.CallAfter in this function, otherwise it may crash
+            # when close the app (e.g., shell is destroyed when wx.CallAfter
+            # function is called)
+            self.output_timer.StartOnce(max(int(self.output_interval * 1000), 1))
+
+    def FlushOutput(self):
+        """write the buffered output to the shell"""
+        with self.output_lock:
+            text = ''.join(self.output_buffer)
+            self.output_buffer = []
+        if not text:
+            return
+        self.output_last_flush = time.time()
         try:
-            if not self.silent:
-                # not use wx.CallAfter in this function, otherwise it may
-                # crash when close the app (e.g., shell is destroyed when
-                # wx.CallAfter function is called
-                self.AutoCompCancel()
-                # move the cursor to the end to protect the readonly section
-                endpos = self.GetTextLength()
-                # remember the current position (relative to end)
-                offset = endpos - self.GetCurrentPos()
-                if not self.CanEdit():
-                    self.SetCurrentPos(endpos)
-                if not self.waiting:# or self.IsDebuggerPaused():
-                    # if the shell is in idle status, output the text right before the prompt
-                    self.SetCurrentPos(self.promptPosStart)
-                    self.write(text)
-                    self.promptPosStart += self.GetTextLength() - endpos
-                    self.promptPosEnd += self.GetTextLength() - endpos
-                else:
-                    if self.GetCurrentLine() \
-                                    == self.LineFromPosition(self.promptPosEnd):
-                        self.write(os.linesep)
-                    self.write(text)
-                # disable undo
-                self.EmptyUndoBuffer()
-                # move the caret to the previous position
-                self.GotoPos(self.GetTextLength()-offset)
-                self.Update()
+            if self.fast_output:
+                self._writeOutFast(text)
             else:
-                if self.stdout:
-                    print(text, file=self.stdout)
-                #for line in traceback.format_stack():
-                #    print(line.strip(), file=self.stdout)
+                self._writeOut(text)
+            self.TrimScrollback()
+            if self.waiting:
+                # the command is running, the shell will not be repainted
+                # until it is done
+                self.Update()
         except:
             if self.stdout:
                 print(text, file=self.stdout)
             traceback.print_exc(file=self.stdout)
 
+    def _writeOut(self, text):
+        self.AutoCompCancel()
+        # move the cursor to the end to protect the readonly section
+        endpos = self.GetTextLength()
+        # remember the current position (relative to end)
+        offset = endpos - self.GetCurrentPos()
+        if not self.CanEdit():
+            self.SetCurrentPos(endpos)
+        if not self.waiting:# or self.IsDebuggerPaused():
+            # if the shell is in idle status, output the text right before the prompt
+            self.SetCurrentPos(self.promptPosStart)
+            pyshell.Shell.write(self, text)
+            self.promptPosStart += self.GetTextLength() - endpos
+            self.promptPosEnd += self.GetTextLength() - endpos
+        else:
+            if self.GetCurrentLine() \
+                            == self.LineFromPosition(self.promptPosEnd):
+                pyshell.Shell.write(self, os.linesep)
+            pyshell.Shell.write(self, text)
+        # disable undo
+        self.EmptyUndoBuffer()
+        # move the caret to the previous position
+        self.GotoPos(self.GetTextLength()-offset)
+
+    def _writeOutFast(self, text):
+        text = self.fixLineEndings(text)
+        endpos = self.GetTextLength()
+        if not self.waiting:
+            # output the text right before the prompt
+            pos = self.promptPosStart
+        else:
+            pos = endpos
+            if self.LineFromPosition(endpos) == self.LineFromPosition(self.promptPosEnd):
+                text = os.linesep + text
+        self.SetUndoCollection(False)
+        self.InsertText(pos, text)
+        self.SetUndoCollection(True)
+        if not self.waiting:
+            self.promptPosStart += self.GetTextLength() - endpos
+            self.promptPosEnd += self.GetTextLength() - endpos
+            # the undo buffer is emptied in prompt() when the command is done
+            self.EmptyUndoBuffer()
+        else:
+            # InsertText doesn't move the caret if it is at the insert position
+            self.GotoPos(self.GetTextLength())
+
+    def OnOutputTimer(self, event):
+        self.FlushOutput()
+
+    def OnIdle(self, event):
+        if self.output_buffer and not self.output_timer.IsRunning():
+            delay = self.output_last_flush + self.output_interval - time.time()
+            if delay <= 0:
+                self.FlushOutput()
+            else:
+                self.output_timer.StartOnce(max(int(delay * 1000), 1))
+        super().OnIdle(event)
+
+    def write(self, text):
+        """Display text in the shell."""
+        # keep the order with the buffered output
+        if self.output_buffer and wx.IsMainThread():
+            self.FlushOutput()
+        super().write(text)
+
+    def clear(self):
+        """Delete all text from the shell."""
+        with self.output_lock:
+            self.output_buffer = []
+        super().clear()
+
     def writeErr(self, text):
         """Replacement for stderror"""
         self.writeOut(text)
 
     def addHistory(self, command):
-        # override the parent function to add time-stamp.
-        stamp = time.strftime('#bsm#%Y/%m/%d')
-        if stamp not in self.history:
-            self.history.insert(0, stamp)
-        super().addHistory(command)
+        # override the parent function to save the history to the history
+        # store with time-stamp.
+        self.historyIndex = -1
+        self.historyPrefix = 0
+        if command != '' \
+           and (len(self.history) == 0 or command != self.history[0]):
+            if isinstance(self.history, HistoryStore):
+                self.history.Append(command)
+            else:
+                # history store is not loaded yet (e.g., startup script)
+                self.history.insert(0, command)
+            dp.send(signal="Shell.addHistory", command=command)
+
+    def clearHistory(self):
+        if isinstance(self.history, HistoryStore):
+            self.history.Clear()
+        else:
+            self.history = []
+        self.historyIndex = -1
+        dp.send(signal="Shell.clearHistory")
 
     def deleteHistory(self, command, timestamp="", index=-1):
-        for i in six.moves.range(len(self.history) - 1, -1, -1):
-            if self.history[i] == timestamp:
-                if command == timestamp:
-                    # delete folder
-                    m = 1
-                    while(i-m>=0 and not self.history[i-m].startswith('#bsm#')):
-                        m += 1
-                    del self.history[i-m+1:i]
-                    break
-                else:
-                    idx = i-index-1
-                    if idx>=0 and self.history[idx] == command:
-                        del self.history[idx]
-                    break
+        day = timestamp
+        if day.startswith(TIME_STAMP_HEADER):
+            day = day[len(TIME_STAMP_HEADER):]
+        if command == timestamp:
+            # delete folder
+            self.history.DeleteDay(day)
+        else:
+            self.history.Delete(day, command, index if index >= 0 else None)
+        self.historyIndex = -1
 
     def runCommand(self,
                    command,
@@ -659,6 +904,12 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
                    debug=False,
                    history=True):
         """run the command in the shell"""
+        if self.IsWorkerRunning():
+            # run it after the current command is done
+            self.command_queue.append((self.runCommand,
+                                       (command, prompt, verbose, debug, history)))
+            return
+        self.FlushOutput()
         if not self.enable_debugger:
             self.enable_debugger = debug
         self.autoIndent = False
@@ -724,6 +975,10 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
             self.lastUpdate = None
             self.waiting = False
             self.silent = False
+            if self.output_buffer and \
+                    time.time() - self.output_last_flush >= self.output_interval:
+                # show the output of the statement before running the next one
+                self.FlushOutput()
             if not self.more and history:
                 # finished a statement, add it to history
                 self.addHistory('\n'.join(cmd_raw))
@@ -733,17 +988,79 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
 
     def push(self, command, silent=False, history=True):
         """Send command to the interpreter for execution."""
+        self.FlushOutput()
         self.running = True
         if not silent:
             self.write(os.linesep)
         # push to the debugger
         if self.waiting and self.IsDebuggerOn():
             self.debugger.push_line(command)
+            self.completion.invalidate()
             return
 
         # DNM
         self.push_multiple_line(command, silent=silent, history=history)
         self.running = False
+        self.completion.invalidate(self.interp.locals)
+        if self.command_queue and not self.IsWorkerRunning():
+            wx.CallAfter(self.RunQueuedCommands)
+
+    def RunQueuedCommands(self):
+        """run the commands received when the worker is running"""
+        while self.command_queue and not self.IsWorkerRunning():
+            fn, args = self.command_queue.pop(0)
+            fn(*args)
+
+    def IsWorkerRunning(self):
+        # the command runs in the worker, or waits for the sx process
+        return (self.worker is not None and self.worker.is_alive()) or \
+               SxProcess.foreground is not None
+
+    def runcode(self, code):
+        """run the compiled code (replace interp.runcode)"""
+        if not self.run_in_thread or self.enable_debugger or \
+                not wx.IsMainThread() or self.IsWorkerRunning():
+            type(self.interp).runcode(self.interp, code)
+            return
+
+        interp = self.interp
+
+        def _run():
+            try:
+                exec(code, interp.locals)
+            except SystemExit:
+                print('SystemExit is ignored in background thread')
+            except BaseException:
+                # including KeyboardInterrupt from InterruptWorker
+                interp.showtraceback()
+
+        # the output from the worker is buffered by writeOut, and flushed in
+        # the main thread
+        self.worker = threading.Thread(target=_run, daemon=True)
+        self.worker.start()
+        # keep the UI responsive until the command is done
+        while self.worker.is_alive():
+            wx.GetApp().Yield(onlyIfNeeded=True)
+            self.worker.join(0.02)
+            if time.time() - self.output_last_flush >= self.output_interval:
+                self.FlushOutput()
+        self.worker = None
+        self.FlushOutput()
+
+    def InterruptWorker(self):
+        """raise KeyboardInterrupt in the worker thread"""
+        if SxProcess.foreground is not None:
+            # terminate the sx process the shell is waiting for
+            SxProcess.foreground.cancel()
+            return True
+        worker = self.worker
+        if worker is None or not worker.is_alive():
+            return False
+        # it is raised when the worker runs the next python bytecode, i.e., not
+        # when it is blocked in the C code (e.g., time.sleep)
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(worker.ident),
+                                                   ctypes.py_object(KeyboardInterrupt))
+        return True
 
     def lstripPrompt(self, text):
         """Return text without a leading prompt."""
@@ -755,10 +1072,31 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
                 break
         return text
 
+    def readline(self):
+        """Replacement for stdin.readline()."""
+        if wx.IsMainThread():
+            return super().readline()
+        # the command runs in the worker thread, show the prompt in the main
+        # thread, and wait for the user to hit Enter (processLine sets the
+        # reader.input)
+        reader = self.reader
+        reader.input = ''
+        reader.isreading = True
+        wx.CallAfter(self.prompt)
+        try:
+            while not reader.input:
+                time.sleep(0.02)
+            return str(reader.input)
+        finally:
+            reader.input = ''
+            reader.isreading = False
+
     def prompt(self):
         """Display proper prompt for the context: ps1, ps2 or ps3.
 
         If this is a continuation line, autoindent as necessary."""
+        # the prompt position depends on the output
+        self.FlushOutput()
         isreading = self.reader.isreading
         skip = False
         if isreading:
@@ -862,6 +1200,7 @@ class Shell(pyshell.Shell, FindEditorMixin, EditorThemeMixin):
         # The user hit ENTER and we need to decide what to do. They
         # could be sitting on any line in the shell.
 
+        self.FlushOutput()
         thepos = self.GetCurrentPos()
         startpos = self.promptPosEnd
         endpos = self.GetTextLength()
@@ -1,14 +1,27 @@
 import os
 import sys
+import re
+import time
+import timeit
+import cProfile
+import pstats
+import statistics
+import codecs
+import queue
 import keyword
+import inspect
+import threading
+import ctypes
+import signal
 import subprocess as sp
 import traceback
 import glob
 import shlex
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import wx
 import wx.py.dispatcher as dp
 import six
-from .utility import unescape_path
+from .utility import unescape_path, send_data_to_shell
 
 aliasDict = {}
 
@@ -35,6 +48,13 @@ def magicSingle(command):
         command = command[:4] + '("' + command[5:].strip() + '")'
     elif command[:4] in ('doc ', ):
         command = command[:3] + '("' + command[4:].strip() + '")'
+    elif command.startswith(('%timeit ', '%time ', '%prun ')):
+        name, stmt = command[1:].split(' ', 1)
+        options = {'timeit': {'n': 'number', 'r': 'repeat'},
+                   'prun': {'s': 'sort'}}.get(name, {})
+        kwds, stmt = _split_magic_options(stmt.strip(), options)
+        args = ''.join(f', {k}={v!r}' for k, v in kwds.items())
+        command = f'magic_{name}({stmt!r}{args})'
     elif command[:6] == 'close ':
         arg = command[6:].strip()
         if arg.isnumeric():
@@ -111,9 +131,151 @@ def magic(command):
     command = '\n'.join(commandList)
     return command
 
+class SxProcess:
+    """
+    The subprocess started by sx.
+
+    When the output is captured, the stdout/stderr are read by two reader
+    threads (so the child will not be blocked by a full pipe), and written to
+    the shell in chunks by wait(), which keeps the UI responsive when it is
+    called from the main thread.
+    """
+    # the process the shell is waiting for (main thread only)
+    foreground = None
+
+    def __init__(self, args, capture=True, **kwds):
+        self.cancelled = False
+        self.output = queue.Queue()
+        pipe = sp.PIPE if capture else None
+        # start it in its own process group, so cancel() also stops its
+        # children (e.g., 'sleep 10 | cat' started by the shell)
+        if os.name == 'nt':
+            kwds['creationflags'] = kwds.get('creationflags', 0) | \
+                                    sp.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwds.setdefault('start_new_session', True)
+        self.popen = sp.Popen(args, stdout=pipe, stderr=pipe, **kwds)
+        self.readers = []
+        if capture:
+            for f in (self.popen.stdout, self.popen.stderr):
+                t = threading.Thread(target=self._read, args=(f,), daemon=True)
+                t.start()
+                self.readers.append(t)
+
+    def __repr__(self):
+        status = 'running' if self.returncode is None else f'exit {self.returncode}'
+        return f'<SxProcess {self.popen.pid}: {status}>'
+
+    @property
+    def pid(self):
+        return self.popen.pid
+
+    @property
+    def returncode(self):
+        return self.popen.poll()
+
+    def _read(self, f):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            # read1 returns whatever is available, so the output is streamed
+            for chunk in iter(lambda: f.read1(4096), b''):
+                self.output.put(decoder.decode(chunk))
+            self.output.put(decoder.decode(b'', final=True))
+        except (OSError, ValueError):
+            pass
+        finally:
+            f.close()
+
+    def _flush(self):
+        text = []
+        while True:
+            try:
+                text.append(self.output.get_nowait())
+            except queue.Empty:
+                break
+        text = ''.join(text)
+        if text:
+            dp.send('shell.write_out', text=text)
+
+    def _signal(self, kill=False):
+        # signal the whole process group
+        try:
+            if os.name == 'nt':
+                sp.run(['taskkill', '/T', '/F', '/PID', str(self.popen.pid)],
+                       stdout=sp.DEVNULL, stderr=sp.DEVNULL,
+                       creationflags=sp.CREATE_NO_WINDOW)
+            else:
+                os.killpg(self.popen.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except (OSError, sp.SubprocessError):
+            # e.g., the group is gone
+            pass
+        if self.returncode is None:
+            if kill:
+                self.popen.kill()
+            else:
+                self.popen.terminate()
+
+    def cancel(self):
+        """terminate the process (and its children)"""
+        if self.returncode is None or self._reading():
+            self.cancelled = True
+            self._signal()
+
+    def _reading(self):
+        return any(t.is_alive() for t in self.readers)
+
+    def running(self):
+        if self.returncode is None:
+            return True
+        # the pipes may be held by its children; after it is cancelled, they
+        # are killed in wait() if they do not quit in time
+        return self._reading()
+
+    def wait(self, interval=0.02):
+        """wait for the process to finish, return the exit code"""
+        killed = None
+        try:
+            while True:
+                try:
+                    if not self.running():
+                        break
+                    self._flush()
+                    app = wx.GetApp()
+                    if app is not None and wx.IsMainThread():
+                        app.Yield(onlyIfNeeded=True)
+                    time.sleep(interval)
+                    if self.cancelled:
+                        # kill it (and its children) if it does not quit in
+                        # time, and stop waiting for the pipes held by the
+                        # process out of its group
+                        if killed is None:
+                            killed = time.time()
+                        elif time.time() - killed > 2:
+                            self._signal(kill=True)
+                            if self.returncode is not None and \
+                                    time.time() - killed > 4:
+                                break
+                except KeyboardInterrupt:
+                    # e.g., Ctrl+C on the shell worker thread or cancel the job
+                    self.cancel()
+        finally:
+            if self.running():
+                # e.g., the unexpected error, not leave the process running
+                self.cancel()
+        self._flush()
+        if self.cancelled:
+            print(f'\nCancelled: {self.popen.args}')
+        return self.returncode
+
 def sx(cmd, *args, **kwds):
+    """
+    Run the shell command, and show its output in the shell while it runs.
+
+    Return the exit code if it fails (None for success). Append '&' to run it
+    in background (without capturing the output), which returns the
+    SxProcess, e.g., to check its returncode or cancel() it.
+    """
     wait = True
-    # append '&' to capture the output
     if cmd[-1] == '&':
         wait = False
         cmd = cmd[0:-1]
@@ -121,35 +283,32 @@ def sx(cmd, *args, **kwds):
     if wx.Platform == '__WXMSW__':
         startupinfo = sp.STARTUPINFO()
         startupinfo.dwFlags |= sp.STARTF_USESHOWWINDOW
-    # try the shell command first
-    try:
-        if wait:
-            p = sp.Popen(shlex.split(cmd),
-                         startupinfo=startupinfo,
-                         stdout=sp.PIPE,
-                         stderr=sp.PIPE,
-                         shell=True)
-            dp.send('shell.write_out', text=p.stderr.read().decode())
-            dp.send('shell.write_out', text=p.stdout.read().decode())
-        else:
-            p = sp.Popen(shlex.split(cmd), startupinfo=startupinfo, shell=True)
-        return
-    except:
-        traceback.print_exc(file=sys.stdout)
+    # try the shell command first, then the standalone command
+    p = None
+    for shell in (True, False):
+        args = shlex.split(cmd)
+        if shell and wx.Platform != '__WXMSW__':
+            # with shell, the first item is the command, others are the
+            # arguments of the shell itself
+            args = cmd
+        try:
+            p = SxProcess(args, capture=wait, startupinfo=startupinfo,
+                          shell=shell)
+            break
+        except:
+            traceback.print_exc(file=sys.stdout)
+    if p is None or not wait:
+        return p
 
-    # try the standalone command
+    foreground = wx.IsMainThread() and SxProcess.foreground is None
+    if foreground:
+        SxProcess.foreground = p
     try:
-        if wait:
-            p = sp.Popen(shlex.split(cmd),
-                         startupinfo=startupinfo,
-                         stdout=sp.PIPE,
-                         stderr=sp.PIPE)
-            dp.send('shell.write_out', text=p.stdout.read().decode())
-        else:
-            p = sp.Popen(shlex.split(cmd), startupinfo=startupinfo)
-        return
-    except:
-        traceback.print_exc(file=sys.stdout)
+        code = p.wait()
+    finally:
+        if foreground:
+            SxProcess.foreground = None
+    return code if code else None
 
 def pwd():
     print(os.getcwd())
@@ -172,3 +331,292 @@ def ls(path='*',fullpath=False):
     else:
         for i in g:
             print(os.path.split(i)[1])
+
+def _split_magic_options(stmt, options):
+    """split the leading options (e.g., '-n 100') from the statement"""
+    kwds = {}
+    while True:
+        m = re.match(r'-(\w)\s*(\S+)\s+', stmt)
+        if not m or m.group(1) not in options:
+            break
+        v = m.group(2)
+        if options[m.group(1)] != 'sort':
+            if not v.isdigit():
+                break
+            v = int(v)
+        kwds[options[m.group(1)]] = v
+        stmt = stmt[m.end():]
+    return kwds, stmt
+
+def _caller_namespace():
+    # the namespace of the caller of the magic function, i.e., shell
+    frame = inspect.currentframe().f_back.f_back
+    return frame.f_globals, frame.f_locals
+
+def _compile_statement(stmt):
+    try:
+        return compile(stmt, '<magic>', 'eval')
+    except SyntaxError:
+        return compile(stmt, '<magic>', 'exec')
+
+def format_time(t):
+    """format the time in seconds, e.g., 1.23 ms"""
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if t >= scale:
+            return f'{t/scale:.3g} {unit}'
+    return f'{t/1e-9:.3g} ns'
+
+def magic_time(stmt):
+    """%time stmt: run the statement once, and print the CPU/wall time"""
+    g, l = _caller_namespace()
+    code = _compile_statement(stmt)
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        return eval(code, g, l)
+    finally:
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+        print(f'CPU time: {format_time(cpu)}, Wall time: {format_time(wall)}')
+
+def magic_timeit(stmt, number=0, repeat=7, max_time=2.0):
+    """
+    %timeit [-n number] [-r repeat] stmt: time the statement
+
+    If number is 0, it is determined automatically so each run takes at least
+    0.2s, and the number of runs is reduced so the total time is about
+    max_time (at least one run).
+    """
+    g, l = _caller_namespace()
+    ns = g if l is g else {**g, **l}
+    timer = timeit.Timer(stmt, globals=ns)
+    timings = []
+    if number <= 0:
+        number, t = timer.autorange()
+        timings.append(t)
+        repeat = max(1, min(repeat, int(max_time / max(t, 1e-9))))
+    timings += timer.repeat(repeat - len(timings), number)
+    timings = [t / number for t in timings]
+    mean = statistics.mean(timings)
+    std = statistics.stdev(timings) if len(timings) > 1 else 0
+    runs = len(timings)
+    print(f'{format_time(mean)} ± {format_time(std)} per loop (mean ± std. dev. '
+          f'of {runs} run{"s" if runs > 1 else ""}, {number} loop{"s" if number > 1 else ""} each)')
+
+def magic_prun(stmt, sort='cumulative'):
+    """
+    %prun [-s sort] stmt: profile the statement with cProfile
+
+    The stats are shown in the profile panel if available; otherwise, the top
+    ones are printed.
+    """
+    g, l = _caller_namespace()
+    prof = cProfile.Profile()
+    try:
+        prof.runctx(stmt, g, l)
+    finally:
+        stats = pstats.Stats(prof)
+        resp = dp.send('profile.show', stats=stats, title=stmt, sort=sort)
+        if not resp:
+            stats.sort_stats(sort).print_stats(20)
+
+class Job:
+    """the callable running in background, created by JobManager.submit"""
+    def __init__(self, jid, name, result_name, process=False):
+        self.id = jid
+        self.name = name
+        # the variable name to add the result to the shell
+        self.result_name = result_name
+        self.process = process
+        self.future = None
+        self.start = time.time()
+        self.end = None
+        # 0~1, updated by the callable (thread job only)
+        self.progress = None
+        self.thread_id = None
+        self.lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}: {self.status}>'
+
+    @property
+    def status(self):
+        if self._cancel.is_set():
+            return 'cancelled'
+        if self.future is None:
+            return 'pending'
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'done'
+        if self.future.running():
+            return 'running'
+        return 'pending'
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.end or time.time()) - self.start
+
+    def set_progress(self, progress):
+        self.progress = min(max(float(progress), 0.), 1.)
+
+    def cancel(self):
+        if self.future is None or self.future.done():
+            return False
+        self._cancel.set()
+        if self.future.cancel():
+            # not started yet
+            return True
+        with self.lock:
+            if self.thread_id is not None:
+                # raise KeyboardInterrupt in the running thread; the process job
+                # can't be stopped, and its result will be ignored
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self.thread_id),
+                    ctypes.py_object(KeyboardInterrupt))
+        return True
+
+    def result(self):
+        if self.future is None or not self.future.done() or self.cancelled:
+            return None
+        return self.future.result()
+
+class JobManager:
+    """
+    Run the callables in background (thread or process pool), e.g.,
+        >>> jobs.submit(analyze, 'a.log', name='a', result='a_result')
+    When it is done, the result is added to the shell (default variable:
+    job1, job2, ...). If the callable has an argument 'job', the Job object is
+    passed to it (thread job only), so it can report the progress
+    (job.set_progress(0.5)) or check if it is cancelled (job.cancelled).
+
+    With process=True, the callable and its arguments are pickled to the
+    worker process, so the callable shall be defined at the module level of an
+    importable module (i.e., not a lambda or a function defined in the shell).
+
+        >>> jobs              # list the jobs
+        >>> jobs.cancel(1)    # cancel job 1
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.jobs = {}
+        self.next_id = 1
+        self._threads = None
+        self._processes = None
+
+    def __repr__(self):
+        if not self.jobs:
+            return 'No jobs'
+        lines = [f'{"#":>4} {"name":<24} {"status":<10} {"progress":>8} {"elapsed":>9}']
+        for job in self.jobs.values():
+            progress = '' if job.progress is None else f'{job.progress*100:.0f}%'
+            lines.append(f'{job.id:>4} {job.name[:24]:<24} {job.status:<10} '
+                         f'{progress:>8} {job.elapsed:>8.1f}s')
+        return '\n'.join(lines)
+
+    def __getitem__(self, jid):
+        return self.jobs[jid]
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def submit(self, fn, *args, name=None, result=None, process=False, **kwargs):
+        """run fn(*args, **kwargs) in background, and return the Job"""
+        jid = self.next_id
+        self.next_id += 1
+        if name is None:
+            name = getattr(fn, '__name__', f'job{jid}')
+        if result is None:
+            result = f'job{jid}'
+        job = Job(jid, name, result, process)
+        if process:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            job.future = self._processes.submit(fn, *args, **kwargs)
+        else:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                if 'job' in inspect.signature(fn).parameters:
+                    kwargs['job'] = job
+            except (TypeError, ValueError):
+                pass
+            job.future = self._threads.submit(self._run, job, fn, args, kwargs)
+        self.jobs[jid] = job
+        job.future.add_done_callback(lambda f: self._done(job))
+        self._notify(job)
+        return job
+
+    @staticmethod
+    def _run(job, fn, args, kwargs):
+        with job.lock:
+            if job.cancelled:
+                return None
+            job.thread_id = threading.get_ident()
+        job.start = time.time()
+        try:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                # no KeyboardInterrupt will be raised after this
+                with job.lock:
+                    job.thread_id = None
+        except KeyboardInterrupt:
+            # it may be delivered after fn returns
+            if job.cancelled:
+                return None
+            raise
+
+    @staticmethod
+    def _notify(job):
+        # the panel may only be updated in the main thread
+        if not wx.IsMainThread():
+            wx.CallAfter(dp.send, 'jobs.updated', job=job)
+        else:
+            dp.send('jobs.updated', job=job)
+
+    def _done(self, job):
+        # called from the worker thread
+        job.end = time.time()
+        wx.CallAfter(self._finished, job)
+
+    def _finished(self, job):
+        if job.cancelled:
+            print(f'Job {job.id} ({job.name}) is cancelled')
+        elif job.future.exception() is not None:
+            e = job.future.exception()
+            print(f'Job {job.id} ({job.name}) failed:')
+            traceback.print_exception(type(e), e, e.__traceback__, file=sys.stdout)
+        else:
+            if job.progress is not None:
+                job.progress = 1.
+            send_data_to_shell(job.result_name, job.future.result())
+        self._notify(job)
+
+    def cancel(self, jid):
+        job = self.jobs.get(jid, None)
+        if job is None:
+            return False
+        cancelled = job.cancel()
+        self._notify(job)
+        return cancelled
+
+    def clear(self):
+        """remove the finished jobs"""
+        self.jobs = {k: j for k, j in self.jobs.items() if not j.future.done()}
+        self._notify(None)
+
+    def running(self):
+        return [j for j in self.jobs.values() if not j.future.done()]
+
+    def shutdown(self):
+        for job in self.running():
+            job.cancel()
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+jobs = JobManager()
@@ -1,4 +1,11 @@
+import sys
 import platform
+import traceback
+import time
+import tempfile
+import warnings
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
 import wx
 import wx.py.dispatcher as dp
 import aui2 as aui
@@ -8,28 +15,580 @@ from .bsmxpm import pause_svg, pause_grey_svg, run_svg, run_grey_svg, more_svg,
                     save_svg, save_gray_svg, copy_svg, copy_gray_svg, new_page_svg
 from .pymgr_helpers import Gcm
 from .utility import svg_to_bitmap
+from .sharedframes import SharedFrameRing
+from .framesource import FrameSource
+from .frameexport import FrameExporter
 from .fileviewbase import PanelBase
 from .bsminterface import InterfaceRename
 
 
+def is_frame_source(points):
+    """check if points shall be loaded on demand, i.e., np.memmap with
+       frames or frame provider (with __len__ and get_frame(i))"""
+    if isinstance(points, FrameSource) or hasattr(points, 'get_frame'):
+        return True
+    return isinstance(points, np.memmap) and len(points.shape) == 3
+
 class Surface(TrackingSurface):
+    # the policy when the frame buffer is larger than the memory budget
+    #   drop: reduce the buffer length, i.e., drop the oldest frames
+    #   decimate: when the buffer is full, decimate the older half by 2
+    #   memmap: save the frame buffer in a temporary file
+    MEMORY_POLICIES = ('drop', 'decimate', 'memmap')
+    # level of detail: the large image is pooled (block mean/max/min) to a
+    # grid about the size of the viewport, and refined when zoomed in
+    LOD_MODES = ('off', 'mean', 'max', 'min')
+    ID_LOD_OFF = wx.NewIdRef()
+    ID_LOD_MEAN = wx.NewIdRef()
+    ID_LOD_MAX = wx.NewIdRef()
+    ID_LOD_MIN = wx.NewIdRef()
+
     def __init__(self, *args, **kwargs):
         TrackingSurface.__init__(self, *args, **kwargs)
 
         self.SetShowStepSurface(False)
         self.SetShowMode(mesh=True)
 
+        # memory budget of the frame buffer in MB
+        self.memory_budget = 512
+        self.memory_policy = 'drop'
+        # the shared frame ring used as the buffer
+        self.shared = None
+        self.shared_seq = 0
+        # the FrameSource (memmap or frame provider) used as the buffer
+        self.source = None
+        # ((r, c), (min, max, mean, std)) of the selected pixel history in
+        # the FrameSource, computed once when the pixel is selected
+        self.pixel_stats = None
+
+        # pool the image larger than the window, 'off' (default) to always
+        # draw in the original resolution
+        self.lod_mode = 'off'
+        # (rows, cols) of each pooled block
+        self.lod_factor = (1, 1)
+        # max number of points drawn when pooled, e.g., when zoomed in
+        self.lod_max_points = 2**21
+        # the image in original resolution (None if not pooled)
+        self.lod_source = None
+        self.lod_points = None
+        self.lod_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnLodTimer, self.lod_timer)
+
+    def SetBufLen(self, sz):
+        # the actual buffer length may be reduced by the memory budget
+        self.buf_len_requested = sz
+        # timestamp of each frame in buffer (nan if not available)
+        self.timestamps = None
+        # the number of frames filled in the local buffer
+        self.frames_num = 0
+        super().SetBufLen(sz)
+
+    def SetMemoryBudget(self, budget=None, policy=None):
+        if policy is not None and policy not in self.MEMORY_POLICIES:
+            raise ValueError(f'Not supported memory policy: {policy}')
+        if budget is not None:
+            self.memory_budget = max(budget, 1)
+        if policy is not None:
+            self.memory_policy = policy
+        if self.frames is None or not self.IsLocalBuffer():
+            return
+        # re-allocate the buffer and keep the newest frames
+        idx = self.GetFrameIndex()
+        if len(idx) == 0:
+            return
+        frames = np.asarray(self.frames[idx])
+        timestamps = self.timestamps[idx]
+        self.Clear()
+        self.SetBufLen(self.buf_len_requested)
+        self.AppendFrames(frames, silent=True, timestamps=timestamps)
+
+    def SetSharedFrames(self, ring):
+        """use the SharedFrameRing as the frame buffer directly (no copy)"""
+        self.Clear()
+        if ring is None:
+            self.SetBufLen(self.buf_len_requested)
+            return
+        TrackingSurface.SetBufLen(self, ring.length)
+        self.shared = ring
+        self.shared_seq = 0
+        self.frames = ring.frames
+        self.timestamps = ring.timestamps
+        self.frames_idx = ring.sequence % self.buf_len
+        self.SetImage({'z': np.array(self.GetFrame(0), dtype=float)})
+        self.SyncSharedFrames()
+
+    def SyncSharedFrames(self):
+        """sync with the producer, and return the number of new frames"""
+        if self.shared is None:
+            return 0
+        seq = self.shared.sequence
+        num = seq - self.shared_seq
+        if num <= 0:
+            return 0
+        self.shared_seq = seq
+        self.frames_idx = seq % self.buf_len
+        self.frame_display = self.GetFrame(0)
+        rows, cols = self.frames.shape[1:]
+        r, c = self.GetSelectedPixel()
+        if r >= 0 and c >= 0 and r < rows and c < cols:
+            self.selected_buf.buf[:] = self.frames[:, r, c]
+            self.selected_buf.idx = (self.frames_idx - 1) % self.buf_len
+        return num
+
+    def SetFrameSource(self, source, timestamps=None):
+        """
+        use the np.memmap or frame provider (with __len__ and get_frame(i)) as
+        the frame buffer, so only the frames being shown are loaded
+        """
+        self.Clear()
+        if source is None:
+            self.SetBufLen(self.buf_len_requested)
+            return
+        if not isinstance(source, FrameSource):
+            source = FrameSource(source)
+        TrackingSurface.SetBufLen(self, len(source))
+        self.source = source
+        self.frames = source
+        self.timestamps = np.full(self.buf_len, np.nan)
+        if timestamps is not None:
+            self.timestamps[:] = timestamps
+        self.frames_idx = 0
+        self.SetImage({'z': np.array(self.GetFrame(0), dtype=float)})
+        self.SetSelected({})
+
+    def IsLocalBuffer(self):
+        return self.shared is None and self.source is None
+
+    def UseLocalBuffer(self):
+        # the shared/source frames are read-only, switch to the local buffer
+        if not self.IsLocalBuffer():
+            self.Clear()
+            self.SetBufLen(self.buf_len_requested)
+
+    def Clear(self):
+        self.shared = None
+        self.frames_num = 0
+        self.lod_source = None
+        self.pixel_stats = None
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        super().Clear()
+
+    def SetLodMode(self, mode):
+        if mode not in self.LOD_MODES:
+            raise ValueError(f'Not supported LOD mode: {mode}')
+        if mode == self.lod_mode:
+            return
+        self.lod_mode = mode
+        z = self.GetImageData()
+        if z is not None:
+            # re-sample the image with the new mode
+            self.RefreshLod(force=True)
+
+    def GetLodFactor(self, rows, cols):
+        """return the block size (rows, cols) to pool the image for display"""
+        if self.lod_mode == 'off':
+            return 1, 1
+        scale = self.GetContentScaleFactor()
+        # the window may not be laid out yet
+        W = max(self.W * scale, 256) * self.scale['zoom_x']
+        H = max(self.H * scale, 256) * self.scale['zoom_y']
+        fx = max(int(np.ceil(cols / W)), 1)
+        fy = max(int(np.ceil(rows / H)), 1)
+        # when zoomed in, the factor goes to (1, 1); cap the number of points,
+        # otherwise the mesh of the whole image is built in full resolution
+        points = np.ceil(rows / fy) * np.ceil(cols / fx)
+        if points > self.lod_max_points:
+            k = np.sqrt(points / self.lod_max_points)
+            fy, fx = int(np.ceil(fy * k)), int(np.ceil(fx * k))
+        return fy, fx
+
+    def Downsample(self, z, fy, fx):
+        """pool the image z with block size (fy, fx)"""
+        rows, cols = z.shape
+        ry, rx = np.arange(0, rows, fy), np.arange(0, cols, fx)
+        if self.lod_mode == 'mean':
+            d = np.add.reduceat(z, ry, axis=0, dtype=float)
+            d = np.add.reduceat(d, rx, axis=1)
+            n = np.outer(np.diff(np.append(ry, rows)), np.diff(np.append(rx, cols)))
+            return d / n
+        fn = np.maximum if self.lod_mode == 'max' else np.minimum
+        return fn.reduceat(fn.reduceat(z, ry, axis=0), rx, axis=1)
+
+    def GetImageData(self):
+        """return the image being shown, in original resolution"""
+        if self.lod_source is not None:
+            return self.lod_source
+        if self.raw_points:
+            return self.raw_points.get('z', None)
+        return None
+
+    def GetSelectedPixel(self):
+        """return the selected pixel (row, col) in the original image"""
+        r, c = self.selected['y'], self.selected['x']
+        if self.lod_source is None:
+            return r, c
+        # the center of the pooled block
+        fy, fx = self.lod_factor
+        rows, cols = self.lod_source.shape
+        return min(r * fy + fy // 2, rows - 1), min(c * fx + fx // 2, cols - 1)
+
+    def SetImage(self, points):
+        if self.lod_source is not None and points is self.lod_points:
+            # e.g., auto scale
+            points = {'z': self.lod_source}
+        z = points['z']
+        factor = self.GetLodFactor(*z.shape)
+        if factor == (1, 1) or 'x' in points or 'y' in points:
+            self.lod_source = self.lod_points = None
+            self.lod_factor = (1, 1)
+            super().SetImage(points)
+            return
+        self.lod_source = z
+        self.lod_factor = factor
+        fy, fx = factor
+        rows, cols = z.shape
+        # the pooled pixel is drawn at the original coordinate of the block
+        x, y = np.meshgrid(np.arange(0, cols, fx), np.arange(0, rows, fy))
+        self.lod_points = {'x': x, 'y': y, 'z': self.Downsample(z, fy, fx)}
+        super().SetImage(self.lod_points)
+        self.SetRange({'xmax': cols, 'ymax': rows})
+
+    def UpdateImage(self, points):
+        if self.lod_source is None:
+            super().UpdateImage(points)
+        elif points.shape != self.lod_source.shape:
+            self.SetImage({'z': points})
+        else:
+            self.lod_source = points
+            super().UpdateImage(self.Downsample(points, *self.lod_factor))
+
+    def RefreshLod(self, force=False):
+        """re-sample the image if the viewport/zoom changes"""
+        z = self.GetImageData()
+        if z is None or (self.lod_source is None and
+                         ('x' in self.raw_points or 'y' in self.raw_points)):
+            return
+        if force or self.GetLodFactor(*z.shape) != self.lod_factor:
+            r, c = self.GetSelectedPixel()
+            self.SetImage({'z': z})
+            # keep the selected pixel
+            fy, fx = self.lod_factor
+            self.SetSelected({'x': c // fx, 'y': r // fy})
+
+    def OnLodTimer(self, event):
+        self.RefreshLod()
+
+    def OnMouseWheel(self, event):
+        super().OnMouseWheel(event)
+        # wait until the user stops zooming
+        self.lod_timer.StartOnce(200)
+
+    def OnSize(self, event):
+        super().OnSize(event)
+        # may be called during initialization
+        if getattr(self, 'lod_timer', None):
+            self.lod_timer.StartOnce(200)
+
+    def SetSelected(self, sel):
+        self.selected.update(sel)
+        stats, self.pixel_stats = self.pixel_stats, None
+        if self.frames is not None:
+            r, c = self.GetSelectedPixel()
+            _, rows, cols = self.frames.shape
+            if r >= 0 and c >= 0 and r < rows and c < cols:
+                if self.source is None:
+                    self.selected_buf.buf = self.frames[:, r, c]
+                elif stats is not None and stats[0] == (r, c):
+                    # same pixel (e.g., the LOD factor is changed)
+                    self.pixel_stats = stats
+                else:
+                    # read the history from the source only once; the frames
+                    # not loaded yet are nan
+                    d = self.frames[:, r, c]
+                    self.pixel_stats = ((r, c), self.GetPixelStats(d))
+                    self.selected_buf.buf = np.nan_to_num(d)
+        self.UpdateHudText()
+        self.Invalidate()
+
+    def UpdateHudText(self):
+        if self.source is None and self.lod_source is None:
+            super().UpdateHudText()
+            return
+        # report the original value (not the pooled one); and the pixel
+        # history of the frame provider may be partially loaded (nan for the
+        # frames not loaded yet)
+        z = self.GetImageData()
+        r, c = self.GetSelectedPixel()
+        rows, cols = z.shape
+        if r < 0 or c < 0 or r >= rows or c >= cols:
+            return
+        txt = '(%d, %d) %f' % (c, r, z[r, c])
+        stats = None
+        if self.pixel_stats is not None and self.pixel_stats[0] == (r, c):
+            stats = self.pixel_stats[1]
+        elif self.source is None and self.frames is not None and \
+                tuple(self.frames.shape[1:]) == z.shape:
+            # the local buffer may change with every frame
+            stats = self.GetPixelStats(self.frames[:, r, c])
+        if stats is not None:
+            txt += ' min: %f max: %f mean: %.2f std: %.2f' % stats
+        if self.lod_source is not None:
+            txt += ' LOD: %dx%d' % self.lod_factor
+        self.SetHudText(txt)
+
+    @staticmethod
+    def GetPixelStats(d):
+        """return the min/max/mean/std of the pixel history (ignore nan)"""
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            return (np.nanmin(d), np.nanmax(d), np.nanmean(d), np.nanstd(d))
+
+    def GetFrameNum(self):
+        """return the number of the filled frames in buffer"""
+        if self.frames is None:
+            return 0
+        if self.shared is not None:
+            return min(self.shared_seq, self.buf_len)
+        if self.source is not None:
+            return self.buf_len
+        return self.frames_num
+
+    def GetFrameIndex(self):
+        """return the buffer index of the filled frames, from the oldest to the
+           newest"""
+        num = self.GetFrameNum()
+        return (self.frames_idx - num + np.arange(num)) % self.buf_len
+
+    def GetFrameTimes(self):
+        """return the timestamps of the frames, from the oldest to the newest;
+           nan for the slots not filled yet"""
+        if self.frames is None or self.timestamps is None:
+            return None
+        idx = (self.frames_idx + np.arange(self.buf_len)) % self.buf_len
+        times = self.timestamps[idx]
+        times[:self.buf_len - self.GetFrameNum()] = np.nan
+        return times
+
+    def GetMemoryUsage(self):
+        """return the size (in bytes) of the frame buffer in memory and on disk"""
+        if self.source is not None:
+            disk = 0
+            if isinstance(self.source.source, np.memmap):
+                disk = self.source.source.nbytes
+            return self.source.nbytes_cached, disk
+        if self.frames is None or self.shared is not None:
+            return 0, 0
+        if isinstance(self.frames, np.memmap):
+            return 0, self.frames.nbytes
+        return self.frames.nbytes, 0
+
+    def AllocateFrames(self, rows, cols):
+        frame_size = rows * cols * np.dtype(float).itemsize
+        budget = self.memory_budget * 1024 * 1024
+        buf_len = self.buf_len_requested
+        spill = buf_len * frame_size > budget
+        if spill and self.memory_policy != 'memmap':
+            buf_len = max(int(budget // frame_size), 1)
+        if buf_len != self.buf_len:
+            TrackingSurface.SetBufLen(self, buf_len)
+        shape = (self.buf_len, rows, cols)
+        if spill and self.memory_policy == 'memmap':
+            self.frames = np.memmap(tempfile.TemporaryFile(), dtype=float,
+                                    mode='w+', shape=shape)
+        else:
+            self.frames = np.zeros(shape)
+        self.timestamps = np.full(self.buf_len, np.nan)
+        self.frames_idx = 0
+        self.frames_num = 0
+
+    def DecimateFrames(self):
+        """decimate the older half of the (full) buffer by 2"""
+        if self.memory_policy != 'decimate' or self.buf_len < 4:
+            return
+        half = self.buf_len // 2
+
+        def _decimate(d, empty=0):
+            old, new = d[:half:2].copy(), d[half:].copy()
+            d[:len(old)] = old
+            d[len(old):len(old)+len(new)] = new
+            d[len(old)+len(new):] = empty
+            return len(old) + len(new)
+
+        self.frames_idx = _decimate(self.frames)
+        self.frames_num = self.frames_idx
+        _decimate(self.timestamps, np.nan)
+        if not np.may_share_memory(self.selected_buf.buf, self.frames):
+            # selected_buf.buf may be a view of frames (see SetSelected)
+            _decimate(self.selected_buf.buf)
+        self.selected_buf.idx = self.frames_idx - 1
+
+    def NewFrameArrive(self, frame, silent=True, timestamp=None):
+        self.UseLocalBuffer()
+        rows, cols = frame.shape
+        if self.frames is None or rows != self.frames.shape[1] \
+                or cols != self.frames.shape[2]:
+            self.AllocateFrames(rows, cols)
+            z = self.GetImageData()
+            if z is not None and z.shape == frame.shape:
+                self.frames[self.frames_idx, :, :] = z
+                self.frames_idx += 1
+                self.frames_idx %= self.buf_len
+                self.frames_num += 1
+            self.SetImage({'z': frame})
+
+        idx = self.frames_idx
+        super().NewFrameArrive(frame, silent=silent)
+        self.frames_num = min(self.frames_num + 1, self.buf_len)
+        self.timestamps[idx] = np.nan if timestamp is None else timestamp
+        if self.lod_source is not None:
+            # the selected pixel is in the pooled image
+            r, c = self.GetSelectedPixel()
+            if r >= 0 and c >= 0:
+                self.selected_buf.SetData(self.frame_display[r, c], idx)
+        if self.frames_idx == 0:
+            # buffer is full
+            self.DecimateFrames()
+
+    def SetFrames(self, frames, reset_buf_len=False, time_axis=0, silent=True,
+                  timestamps=None):
+        if len(frames.shape) != 3:
+            self.Clear()
+            if reset_buf_len:
+                self.SetBufLen(1)
+            self.AppendFrames(frames, silent=silent, timestamps=timestamps)
+            return
+        self.Clear()
+        frames = np.moveaxis(frames, time_axis, 0)
+        if reset_buf_len:
+            self.SetBufLen(frames.shape[0])
+        self.AppendFrames(frames, silent=silent, timestamps=timestamps)
+
+    def AppendFrames(self, frames, silent=True, timestamps=None):
+        """
+        append frames (num x rows x cols) to the ring buffer in one shot, only
+        the newest GetBufLen() frames are kept. Different from calling
+        NewFrameArrive for each frame, the image is updated at most once.
+
+        timestamps: optional timestamp (in second) of each frame
+        """
+        self.UseLocalBuffer()
+        if len(frames.shape) == 2:
+            if timestamps is not None:
+                timestamps = np.ravel(timestamps)[-1]
+            self.NewFrameArrive(frames, silent=silent, timestamp=timestamps)
+            return
+        if len(frames) == 0:
+            return
+        if timestamps is None:
+            timestamps = np.full(len(frames), np.nan)
+        timestamps = np.asarray(timestamps, dtype=float)
+        if timestamps.shape != (len(frames),):
+            raise ValueError('The timestamps shall have one value per frame')
+        _, rows, cols = frames.shape
+        if self.frames is None or rows != self.frames.shape[1] \
+                or cols != self.frames.shape[2]:
+            # let NewFrameArrive allocate the buffer
+            self.NewFrameArrive(frames[0], silent=silent or len(frames) > 1,
+                                timestamp=timestamps[0])
+            frames, timestamps = frames[1:], timestamps[1:]
+            if len(frames) == 0:
+                return
+
+        if self.display_mode == self.DISPLAY_MINMAX:
+            # depends on the previous frame, can't be vectorized
+            for f in range(len(frames)):
+                self.NewFrameArrive(frames[f], silent=silent or f < len(frames) - 1,
+                                    timestamp=timestamps[f])
+            return
+        if self.memory_policy == 'decimate' and self.buf_len >= 4:
+            # write the frames to the free space, and decimate when it is full
+            while len(frames):
+                free = self.buf_len - self.frames_idx
+                self.WriteFrames(frames[:free], timestamps[:free])
+                frames, timestamps = frames[free:], timestamps[free:]
+                if self.frames_idx == 0:
+                    self.DecimateFrames()
+        else:
+            self.WriteFrames(frames, timestamps)
+        if not silent:
+            self.UpdateImage(self.frame_display)
+
+    def WriteFrames(self, frames, timestamps):
+        # copy frames to the ring buffer, the buffer shall be allocated
+        _, rows, cols = frames.shape
+        total = len(frames)
+        dropped, frames = frames[:-self.buf_len], frames[-self.buf_len:]
+        timestamps = timestamps[-self.buf_len:]
+        if self.display_mode in (self.DISPLAY_MAX, self.DISPLAY_MIN):
+            fn = np.maximum if self.display_mode == self.DISPLAY_MAX else np.minimum
+            display = self.frame_display
+            if len(dropped):
+                display = fn(display, fn.reduce(dropped, axis=0))
+            frames = fn(fn.accumulate(frames, axis=0), display)
+        num = len(frames)
+
+        # copy to the ring buffer, may wrap around once
+        start = (self.frames_idx + total - num) % self.buf_len
+        end = min(start + num, self.buf_len)
+        head = end - start
+        self.frames[start:end] = frames[:head]
+        self.frames[:num-head] = frames[head:]
+        self.timestamps[start:end] = timestamps[:head]
+        self.timestamps[:num-head] = timestamps[head:]
+        self.frame_display = frames[-1]
+
+        r, c = self.GetSelectedPixel()
+        if r >= 0 and c >= 0 and r < rows and c < cols:
+            buf = self.selected_buf
+            buf.buf[start:end] = frames[:head, r, c]
+            buf.buf[:num-head] = frames[head:, r, c]
+            buf.idx = (start + num - 1) % self.buf_len
+        else:
+            self.SetSelected({'x': 0, 'y': 0})
+
+        self.frames_idx = (start + num) % self.buf_len
+        self.frames_num = min(self.frames_num + total, self.buf_len)
+
     def GetContextMenu(self):
         menu = super().GetContextMenu()
+        lod = wx.Menu()
+        lod.Append(self.ID_LOD_OFF, 'Off', '', wx.ITEM_CHECK)
+        lod.Append(self.ID_LOD_MEAN, 'Block mean', '', wx.ITEM_CHECK)
+        lod.Append(self.ID_LOD_MAX, 'Block max', '', wx.ITEM_CHECK)
+        lod.Append(self.ID_LOD_MIN, 'Block min', '', wx.ITEM_CHECK)
+        menu.AppendSubMenu(lod, 'Level of detail')
         menu.AppendSeparator()
         menu.Append(wx.ID_CLEAR, 'Clear')
         if platform.system() == 'Linux':
             menu.Append(wx.ID_RESET, 'Reset')
         return menu
 
+    def OnUpdateMenu(self, event):
+        eid = event.GetId()
+        if eid == self.ID_LOD_OFF:
+            event.Check(self.lod_mode == 'off')
+        elif eid == self.ID_LOD_MEAN:
+            event.Check(self.lod_mode == 'mean')
+        elif eid == self.ID_LOD_MAX:
+            event.Check(self.lod_mode == 'max')
+        elif eid == self.ID_LOD_MIN:
+            event.Check(self.lod_mode == 'min')
+        else:
+            super().OnUpdateMenu(event)
+
     def OnProcessMenuEvent(self, event):
         eid = event.GetId()
-        if eid == wx.ID_CLEAR:
+        if eid == self.ID_LOD_OFF:
+            self.SetLodMode('off')
+        elif eid == self.ID_LOD_MEAN:
+            self.SetLodMode('mean')
+        elif eid == self.ID_LOD_MAX:
+            self.SetLodMode('max')
+        elif eid == self.ID_LOD_MIN:
+            self.SetLodMode('min')
+        elif eid == wx.ID_CLEAR:
             self.Clear()
         elif eid == wx.ID_RESET:
             try:
@@ -44,6 +603,8 @@ class Surface(TrackingSurface):
                 pass
         else:
             super().OnProcessMenuEvent(event)
+            # e.g., the zoom is reset
+            self.lod_timer.StartOnce(200)
 
 class DataDropTarget(wx.DropTarget):
     def __init__(self, canvas):
@@ -83,6 +644,18 @@ class SurfacePanel(PanelBase):
     ID_SHOW_SLIDER = wx.NewIdRef()
     ID_FORWARD = wx.NewIdRef()
     ID_BACKWARD = wx.NewIdRef()
+    ID_MEMORY_BUDGET = wx.NewIdRef()
+    ID_MEMORY_DROP = wx.NewIdRef()
+    ID_MEMORY_DECIMATE = wx.NewIdRef()
+    ID_MEMORY_MEMMAP = wx.NewIdRef()
+    ID_MAX_FPS = wx.NewIdRef()
+    ID_EXPORT = wx.NewIdRef()
+    # the slider is time based, i.e., [0, SLIDER_STEPS] maps to the time span
+    # of the frame buffer
+    SLIDER_STEPS = 10000
+    PLAY_SPEEDS = [0.25, 0.5, 1, 2, 4, 8, 16]
+    # the frame rate used when the frames have no timestamp
+    DEFAULT_FPS = 20
 
     def __init__(self, parent, title, num):
         PanelBase.__init__(self, parent, title, num=num)
@@ -110,12 +683,26 @@ class SurfacePanel(PanelBase):
                    short_help_string="Copy to clipboard")
 
         tb.AddStretchSpacer()
+        # fixed size, so the toolbar is not laid out again when it changes
+        self.memory_text = wx.StaticText(tb, label='', style=wx.ST_NO_AUTORESIZE)
+        w, h = self.memory_text.GetTextExtent('0000.0/0000 MB (00000.0 MB on disk)')
+        self.memory_text.SetMinSize((w, h))
+        tb.AddControl(self.memory_text)
         tb.AddTool(self.ID_MORE, "More", svg_to_bitmap(more_svg, win=self),
                         wx.NullBitmap, wx.ITEM_NORMAL, "More")
         tb.Realize()
+        self.tb = tb
         sizer.Add(tb, 0, wx.EXPAND, 0)
 
         self.canvas = Surface(self, None)
+        budget, policy = self.canvas.memory_budget, self.canvas.memory_policy
+        resp = dp.send('frame.get_config', group='glsurface', key='memory_budget')
+        if resp and resp[0][1] is not None:
+            budget = resp[0][1]
+        resp = dp.send('frame.get_config', group='glsurface', key='memory_policy')
+        if resp and resp[0][1] in Surface.MEMORY_POLICIES:
+            policy = resp[0][1]
+        self.canvas.SetMemoryBudget(budget, policy)
         sizer.Add(self.canvas, 1, wx.EXPAND | wx.ALL, 0)
         self.tbSlider = aui.AuiToolBar(self,
                                        -1,
@@ -140,10 +727,14 @@ class SurfacePanel(PanelBase):
                               disabled_bitmap=svg_to_bitmap(forward_gray_svg, win=self),
                               kind=aui.ITEM_NORMAL,
                               short_help_string="Go to next frame")
+        self.speed = wx.Choice(self.tbSlider, choices=[f'{s:g}x' for s in self.PLAY_SPEEDS])
+        self.speed.SetSelection(self.PLAY_SPEEDS.index(1))
+        self.speed.SetToolTip("Playback speed")
+        self.tbSlider.AddControl(self.speed)
         self.slider = wx.Slider(self.tbSlider, 0, style=wx.SL_HORIZONTAL | wx.SL_TOP)
         item = self.tbSlider.AddControl(self.slider)
         item.SetProportion(1)
-        self.slider.SetRange(-self.canvas.GetBufLen()+1, 0)
+        self.slider.SetRange(0, self.SLIDER_STEPS)
         self.tbSlider.Realize()
         self.tbSlider.Hide()
         sizer.Add(self.tbSlider, 0, wx.EXPAND | wx.ALL, 0)
@@ -155,9 +746,45 @@ class SurfacePanel(PanelBase):
         self.timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
         self.slider.Bind(wx.EVT_SCROLL, self.OnSelectFrame)
+        self.speed.Bind(wx.EVT_CHOICE, self.OnSelectSpeed)
         #self.timer.Start(100)
         self.is_running = False
         self.last_frame_id = -1
+        # the arrival time of the last batch of frames
+        self.last_arrival = None
+        # current frame, same as TrackingSurface.SetCurrentFrame, i.e.,
+        # 0 for the latest frame, -1 for the 2nd latest one, ...
+        self.frame_pos = 0
+        self.frame_buf_len = self.canvas.GetBufLen()
+        self.play_speed = 1
+        # (wall clock, frame timestamp) when the playback starts
+        self.play_clock = None
+
+        # the frames from graph.data_updated are saved to the buffer
+        # immediately, but only the latest one is rendered, at most max_fps
+        # times per second
+        self.max_fps = 30
+        resp = dp.send('frame.get_config', group='glsurface', key='max_fps')
+        if resp and resp[0][1]:
+            self.max_fps = resp[0][1]
+        self.render_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnRenderTimer, self.render_timer)
+        self.render_pending = 0
+        self.last_render = 0
+        self.render_stats = {'received': 0, 'rendered': 0, 'skipped': 0}
+
+        # the frames from another process via shared memory
+        self.shared_ring = None
+        self.shared_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnSharedTimer, self.shared_timer)
+
+        # export the frames in background
+        self.exporter = None
+
+        # update the memory usage label periodically (not on every frame)
+        self.memory_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnMemoryTimer, self.memory_timer)
+        self.memory_timer.Start(1000)
 
         self.title = title
 
@@ -175,8 +802,49 @@ class SurfacePanel(PanelBase):
 
     def Destroy(self):
         dp.disconnect(self.DataUpdated, 'graph.data_updated')
+        self.render_timer.Stop()
+        self.memory_timer.Stop()
+        if self.exporter is not None:
+            self.exporter.cancel()
+        self.DetachSharedFrames()
         super().Destroy()
 
+    def AttachSharedFrames(self, ring):
+        """show the frames from SharedFrameRing (or its name), which may be
+           written by another process"""
+        self.DetachSharedFrames()
+        if isinstance(ring, str):
+            ring = SharedFrameRing.attach(ring)
+        self.shared_ring = ring
+        self.canvas.SetSharedFrames(ring)
+        self.frame_buf_len = self.canvas.GetBufLen()
+        self.UpdateSlider(0)
+        if self.canvas.GetBufLen() > 1:
+            self.ShowSlider(True)
+        # poll the producer
+        self.shared_timer.Start(int(1000/self.max_fps))
+
+    def DetachSharedFrames(self):
+        self.shared_timer.Stop()
+        if self.shared_ring is None:
+            return
+        if self.canvas.shared is self.shared_ring:
+            self.canvas.SetSharedFrames(None)
+        try:
+            self.shared_ring.close()
+        except BufferError:
+            traceback.print_exc(file=sys.stdout)
+        self.shared_ring = None
+
+    def OnSharedTimer(self, event):
+        if self.canvas.shared is None:
+            # the canvas is cleared or switched to local buffer
+            self.DetachSharedFrames()
+            return
+        num = self.canvas.SyncSharedFrames()
+        if num:
+            self.RequestRender(num)
+
     def DataUpdated(self):
         if not hasattr(self, 'trace_signal'):
             return
@@ -194,14 +862,107 @@ class SurfacePanel(PanelBase):
         if x is None or y is None:
             return
 
-        self.plot(y, clear=False)
+        # the source has no timestamp, use the arrival time; for a batch of
+        # frames, spread them evenly since the previous arrival
+        num = y.shape[0] if len(y.shape) == 3 else 1
+        now = time.time()
+        prev = now if self.last_arrival is None else self.last_arrival
+        self.last_arrival = now
+        timestamps = np.linspace(prev, now, num + 1)[1:]
+        self.canvas.AppendFrames(y, silent=True, timestamps=timestamps)
+        self.RequestRender(y.shape[0] if len(y.shape) == 3 else 1)
+
+    def RequestRender(self, frames=1):
+        """render the latest frame, no faster than max_fps"""
+        self.render_stats['received'] += frames
+        self.render_pending += frames
+        if self.render_timer.IsRunning():
+            return
+        delay = self.last_render + 1.0/self.max_fps - time.perf_counter()
+        self.render_timer.StartOnce(max(int(delay*1000), 1))
+
+    def OnRenderTimer(self, event):
+        if not self.render_pending:
+            return
+        self.render_stats['rendered'] += 1
+        self.render_stats['skipped'] += self.render_pending - 1
+        self.render_pending = 0
+        self.last_render = time.perf_counter()
+        self.UpdateSlider(0)
+
+    def GetRenderStats(self):
+        """return the number of received/rendered/skipped frames"""
+        return dict(self.render_stats)
+
+    def SetMaxFps(self, fps):
+        self.max_fps = max(fps, 1)
+        dp.send('frame.set_config', group='glsurface', max_fps=self.max_fps)
+
+    def GetFrameTimes(self):
+        """return the non-decreasing timestamps of the frames in buffer, from
+           the oldest to the newest; -inf for the frame without timestamp"""
+        times = self.canvas.GetFrameTimes()
+        valid = np.isfinite(times) if times is not None else None
+        if times is None or np.count_nonzero(valid) < 2:
+            return np.arange(self.canvas.GetBufLen()) / self.DEFAULT_FPS
+        times = np.where(valid, times, -np.inf)
+        return np.maximum.accumulate(times)
+
+    def FrameToSlider(self, value, times=None):
+        if times is None:
+            times = self.GetFrameTimes()
+        n = len(times)
+        t0, t1 = times[np.searchsorted(times, -np.inf, side='right')], times[-1]
+        if n <= 1 or t1 <= t0:
+            return self.SLIDER_STEPS
+        r = np.clip((times[value + n - 1] - t0) / (t1 - t0), 0, 1)
+        return int(round(r * self.SLIDER_STEPS))
+
+    def SliderToFrame(self, pos, times=None):
+        if times is None:
+            times = self.GetFrameTimes()
+        n = len(times)
+        first = np.searchsorted(times, -np.inf, side='right')
+        t0, t1 = times[first], times[-1]
+        if n <= 1 or t1 <= t0:
+            return 0
+        # binary search the last frame before t
+        t = t0 + (t1 - t0) * pos / self.SLIDER_STEPS
+        i = np.searchsorted(times, t, side='right') - 1
+        return int(np.clip(i, first, n - 1)) - (n - 1)
 
     def UpdateSlider(self, value):
-        self.slider.SetValue(value)
+        value = min(max(value, -self.canvas.GetBufLen()+1), 0)
+        self.frame_pos = value
+        self.slider.SetValue(self.FrameToSlider(value))
         self.canvas.SetCurrentFrame(value)
 
     def OnSelectFrame(self, event):
-        self.canvas.SetCurrentFrame(self.slider.GetValue())
+        self.frame_pos = self.SliderToFrame(self.slider.GetValue())
+        self.canvas.SetCurrentFrame(self.frame_pos)
+        if self.is_running:
+            # continue playing from the selected frame
+            self.StartPlay()
+
+    def OnSelectSpeed(self, event):
+        self.play_speed = self.PLAY_SPEEDS[self.speed.GetSelection()]
+        if self.is_running:
+            self.StartPlay()
+
+    def StartPlay(self):
+        times = self.GetFrameTimes()
+        n = len(times)
+        if self.frame_pos >= 0:
+            # at the end, restart from the oldest frame
+            first = np.searchsorted(times, -np.inf, side='right')
+            self.UpdateSlider(int(first) - (n - 1))
+        self.play_clock = (time.perf_counter(), times[self.frame_pos + n - 1])
+        self.is_running = True
+        self.timer.Start(int(1000/self.max_fps))
+
+    def StopPlay(self):
+        self.is_running = False
+        self.timer.Stop()
 
     def GetCaption(self):
         return self.title or f"glsurface-{self.num}"
@@ -210,10 +971,9 @@ class SurfacePanel(PanelBase):
         eid = event.GetId()
         multi_frame = self.canvas.frames is not None and self.canvas.GetBufLen() > 1
         if multi_frame:
-            # update the slider range
-            rng = self.slider.GetRange()
-            if rng[1] - rng[0] + 1 != self.canvas.GetBufLen():
-                self.slider.SetRange(-self.canvas.GetBufLen()+1, 0)
+            # the buffer length is changed, show the latest frame
+            if self.frame_buf_len != self.canvas.GetBufLen():
+                self.frame_buf_len = self.canvas.GetBufLen()
                 self.UpdateSlider(0)
 
         if eid == self.ID_RUN:
@@ -222,12 +982,23 @@ class SurfacePanel(PanelBase):
         elif eid == self.ID_PAUSE:
             event.Enable(self.is_running)
         elif eid == self.ID_BACKWARD:
-            event.Enable(multi_frame and self.slider.GetValue() > self.slider.GetMin())
+            event.Enable(multi_frame and self.frame_pos > -self.canvas.GetBufLen()+1)
         elif eid == self.ID_FORWARD:
-            event.Enable(multi_frame and self.slider.GetValue() < self.slider.GetMax())
+            event.Enable(multi_frame and self.frame_pos < 0)
         else:
             event.Skip()
 
+    def OnMemoryTimer(self, event):
+        self.UpdateMemoryUsage()
+
+    def UpdateMemoryUsage(self):
+        ram, disk = self.canvas.GetMemoryUsage()
+        label = f'{ram/1024/1024:.1f}/{self.canvas.memory_budget} MB'
+        if disk:
+            label += f' ({disk/1024/1024:.1f} MB on disk)'
+        if label != self.memory_text.GetLabel():
+            self.memory_text.SetLabel(label)
+
     def ShowSlider(self, show=True):
         self.tbSlider.Show(show)
         self.Layout()
@@ -235,22 +1006,63 @@ class SurfacePanel(PanelBase):
     def OnProcessTool(self, event):
         eid = event.GetId()
         if eid == self.ID_RUN:
-            self.is_running = True
-            self.timer.Start(50)
+            self.StartPlay()
         elif eid == self.ID_PAUSE:
-            self.is_running = False
-            self.timer.Stop()
+            self.StopPlay()
         elif eid == self.ID_MORE:
             menu = wx.Menu()
             mitem = menu.AppendCheckItem(self.ID_SHOW_SLIDER, "Show slider bar")
             mitem.Check(self.tbSlider.IsShown())
+            menu_memory = wx.Menu()
+            menu_memory.Append(self.ID_MEMORY_BUDGET, f"Set budget ({self.canvas.memory_budget} MB) ...")
+            menu_memory.AppendSeparator()
+            policies = [[self.ID_MEMORY_DROP, 'drop', "Drop oldest frames"],
+                        [self.ID_MEMORY_DECIMATE, 'decimate', "Decimate older frames"],
+                        [self.ID_MEMORY_MEMMAP, 'memmap', "Save frames to disk"]]
+            for pid, policy, label in policies:
+                mitem = menu_memory.AppendRadioItem(pid, label)
+                mitem.Check(self.canvas.memory_policy == policy)
+            menu.AppendSubMenu(menu_memory, "Memory")
+            stats = self.render_stats
+            menu.Append(self.ID_MAX_FPS, f"Max frame rate ({self.max_fps} fps, "
+                        f"{stats['skipped']}/{stats['received']} skipped) ...")
+            menu.AppendSeparator()
+            if self.exporter is None:
+                mitem = menu.Append(self.ID_EXPORT, "Export frames ...")
+                mitem.Enable(self.canvas.frames is not None)
+            else:
+                exporter = self.exporter
+                menu.Append(self.ID_EXPORT, f"Cancel export ({exporter.done}/{exporter.total})")
             self.PopupMenu(menu)
+        elif eid == self.ID_EXPORT:
+            if self.exporter is None:
+                self.doExport()
+            else:
+                self.exporter.cancel()
+        elif eid == self.ID_MAX_FPS:
+            dlg = wx.NumberEntryDialog(self, "Max frame rate to render the streaming data",
+                                       "fps:", "Frame rate", self.max_fps, 1, 1000)
+            if dlg.ShowModal() == wx.ID_OK:
+                self.SetMaxFps(dlg.GetValue())
         elif eid == self.ID_SHOW_SLIDER:
             self.ShowSlider(not self.tbSlider.IsShown())
+        elif eid == self.ID_MEMORY_BUDGET:
+            dlg = wx.NumberEntryDialog(self, "Memory budget of the frame buffer",
+                                       "MB:", "Memory", self.canvas.memory_budget,
+                                       1, 1024*1024)
+            if dlg.ShowModal() == wx.ID_OK:
+                self.SetMemoryBudget(budget=dlg.GetValue())
+        elif eid in (self.ID_MEMORY_DROP, self.ID_MEMORY_DECIMATE, self.ID_MEMORY_MEMMAP):
+            policy = 'drop'
+            if eid == self.ID_MEMORY_DECIMATE:
+                policy = 'decimate'
+            elif eid == self.ID_MEMORY_MEMMAP:
+                policy = 'memmap'
+            self.SetMemoryBudget(policy=policy)
         elif eid == self.ID_BACKWARD:
-            self.UpdateSlider(self.slider.GetValue()-1)
+            self.UpdateSlider(self.frame_pos-1)
         elif eid == self.ID_FORWARD:
-            self.UpdateSlider(self.slider.GetValue()+1)
+            self.UpdateSlider(self.frame_pos+1)
         elif eid == wx.ID_COPY:
             bitmap = self.canvas.GetBitmap()
             if bitmap is None:
@@ -271,6 +1083,14 @@ class SurfacePanel(PanelBase):
         else:
             event.Skip()
 
+    def SetMemoryBudget(self, budget=None, policy=None):
+        """set the memory budget (MB) and policy of the frame buffer"""
+        self.canvas.SetMemoryBudget(budget, policy)
+        dp.send('frame.set_config', group='glsurface',
+                memory_budget=self.canvas.memory_budget,
+                memory_policy=self.canvas.memory_policy)
+        self.UpdateMemoryUsage()
+
     def doSave(self):
         wildcard = [
                 [wx.BITMAP_TYPE_BMP, 'Windows bitmap (*.bmp)|*.bmp'],
@@ -303,30 +1123,130 @@ class SurfacePanel(PanelBase):
         else:
             print("No bitmap available!")
 
-    def OnTimer(self, event):
-        if self.slider.GetValue() >= self.slider.GetMax():
-            self.is_running = False
-            self.timer.Stop()
+    def doExport(self):
+        wildcard = ['Compressed numpy file (*.npz)|*.npz',
+                    'HDF5 file (*.h5;*.hdf5)|*.h5;*.hdf5',
+                    'PNG image sequence (*.png)|*.png',
+                    'TIFF image sequence (*.tif;*.tiff)|*.tif;*.tiff']
+        dlg = wx.FileDialog(self, "Export frames", wildcard='|'.join(wildcard),
+                            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_CANCEL:
+            return
+        filename = dlg.GetPath()
+
+        start, stop = 0, self.canvas.GetFrameNum()
+        if stop > 1:
+            current = stop - 1 + self.frame_pos
+            msg = (f"Frames to export (0 for the oldest, {stop-1} for the latest, "
+                   f"current frame: {current}):")
+            dlg = wx.TextEntryDialog(self, msg, "Export frames", f"{start}:{stop}")
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            try:
+                rng = [int(v) if v.strip() else None for v in dlg.GetValue().split(':')]
+                start, stop, _ = slice(*rng[:2]).indices(stop)
+            except (ValueError, TypeError):
+                print(f"Invalid frame range: {dlg.GetValue()}")
+                return
+        self.ExportFrames(filename, start, stop)
+
+    def ExportFrames(self, filename, start=0, stop=None):
+        """
+        export the frames [start, stop) in background (0 for the oldest frame),
+        the format is from the file extension (npz, h5/hdf5 or image sequence)
+
+        The frames are read from the buffer directly; so if new frames keep
+        arriving, the oldest ones may be overwritten before exported.
+        """
+        canvas = self.canvas
+        if canvas.frames is None:
+            print("No frames available!")
+            return None
+        if self.exporter is not None:
+            print("Exporting frames is in progress!")
+            return None
+        # only the filled frames
+        num = canvas.GetFrameNum()
+        index = canvas.GetFrameIndex()[start:stop]
+        if len(index) == 0:
+            print("No frames to export!")
+            return None
+        timestamps = canvas.GetFrameTimes()
+        if timestamps is not None:
+            timestamps = timestamps[len(timestamps) - num:][start:stop]
+        cmap = LinearSegmentedColormap.from_list('glsurface', canvas.GetColorMap())
+        rng = canvas.GetRange()
+        try:
+            self.exporter = FrameExporter(canvas.frames, index, filename,
+                                          timestamps=timestamps, cmap=cmap,
+                                          vmin=rng['zmin'], vmax=rng['zmax'],
+                                          progress=self._export_progress)
+        except ValueError:
+            traceback.print_exc(file=sys.stdout)
+            return None
+        self.exporter.start()
+        return self.exporter
+
+    def _export_progress(self, done, total, finished):
+        # called from the export thread
+        wx.CallAfter(self.OnExportProgress, done, total, finished)
+
+    def OnExportProgress(self, done, total, finished):
+        exporter = self.exporter
+        if exporter is None:
             return
-        self.UpdateSlider(self.slider.GetValue()+1)
+        if not finished:
+            text = f"Exporting frames {done}/{total} ..."
+        else:
+            self.exporter = None
+            if exporter.error is not None:
+                text = f"Failed to export frames: {exporter.error}"
+            elif exporter.cancelled:
+                text = "Exporting frames cancelled"
+            else:
+                text = f"Exported {total} frames to {exporter.filename}"
+        dp.send('frame.show_status_text', text=text)
 
+    def OnTimer(self, event):
+        if self.frame_pos >= 0 or self.play_clock is None:
+            self.StopPlay()
+            return
+        # the frame at current time; skip the frames in between if the
+        # rendering can't keep up
+        times = self.GetFrameTimes()
+        n = len(times)
+        wall, t = self.play_clock
+        t += (time.perf_counter() - wall) * self.play_speed
+        i = min(np.searchsorted(times, t, side='right') - 1, n - 1)
+        value = int(i) - (n - 1)
+        if value > self.frame_pos:
+            self.UpdateSlider(value)
 
-    def plot(self, points, clear=True):
-        if clear:
-            self.canvas.SetFrames(points, reset_buf_len=True, silent=False)
+    def plot(self, points, clear=True, timestamps=None):
+        if is_frame_source(points):
+            # load the frames on demand
+            self.canvas.SetFrameSource(points, timestamps=timestamps)
+            self.frame_buf_len = self.canvas.GetBufLen()
+            self.UpdateSlider(0)
+            if self.canvas.GetBufLen() > 1:
+                self.ShowSlider(True)
+        elif clear:
+            self.canvas.SetFrames(points, reset_buf_len=True, silent=False,
+                                  timestamps=timestamps)
             # update the slider
-            self.slider.SetRange(-self.canvas.GetBufLen()+1, 0)
+            self.frame_buf_len = self.canvas.GetBufLen()
             self.UpdateSlider(0)
             if self.canvas.frames is not None and self.canvas.GetBufLen() > 1:
                 # show slider if needed
                 self.ShowSlider(True)
         else:
-            if len(points.shape) == 3:
-                shape = list(points.shape)
-                for f in range(shape[0]):
-                    self.canvas.NewFrameArrive(points[f, :, :], silent=False)
-            else:
-                self.canvas.NewFrameArrive(points, silent=False)
+            self.AppendFrames(points, timestamps=timestamps)
+
+    def AppendFrames(self, frames, timestamps=None):
+        """append one frame (rows x cols) or frames (num x rows x cols)"""
+        self.canvas.AppendFrames(frames, silent=True, timestamps=timestamps)
+        # show the latest frame
+        self.UpdateSlider(0)
 
 
 class GLSurface(InterfaceRename):
@@ -6,8 +6,10 @@ import subprocess
 import platform
 import keyword
 import re
-import glob
+import time
+import heapq
 from pathlib import Path
+from collections import OrderedDict
 from collections.abc import MutableMapping
 import six
 import pandas as pd
@@ -109,18 +111,47 @@ class FastLoadTreeCtrl(wx.TreeCtrl):
             self.SortChildren(item)
         return True
 
-def svg_to_bitmap(svg, size=None, win=None):
+# process-wide LRU cache of the rasterized svg images, keyed by (svg content,
+# size, scale factor); the svg content already includes any colour
+# substitution (e.g., AuiPathBar._update_svg), so each colour variant gets its
+# own entry
+_svg_bitmap_cache = OrderedDict()
+_svg_bitmap_cache_size = 512
+
+def svg_to_bitmap(svg, size=None, win=None, cache=True):
     if size is None:
         if wx.Platform == '__WXMSW__':
             size = (24, 24)
         else:
             size = (16, 16)
+    size = tuple(size)
+    scale = win.GetContentScaleFactor() if win else 1
+    key = (svg, size, scale)
+    if cache:
+        bmp = _svg_bitmap_cache.get(key, None)
+        if bmp is not None and bmp.IsOk():
+            _svg_bitmap_cache.move_to_end(key)
+            return bmp
     bmp = wx.svg.SVGimage.CreateFromBytes(str.encode(svg))
     bmp = bmp.ConvertToScaledBitmap(size, win)
     if win:
-        bmp.SetScaleFactor(win.GetContentScaleFactor())
+        bmp.SetScaleFactor(scale)
+    if cache:
+        _svg_bitmap_cache[key] = bmp
+        _svg_bitmap_cache.move_to_end(key)
+        while len(_svg_bitmap_cache) > _svg_bitmap_cache_size:
+            _svg_bitmap_cache.popitem(last=False)
     return bmp
 
+def warm_up_svg_bitmap(svgs, size=None, win=None):
+    """rasterize the svg images in advance, so the following svg_to_bitmap
+    calls (e.g., from the toolbars) will hit the cache"""
+    for svg in svgs:
+        svg_to_bitmap(svg, size=size, win=win)
+
+def clear_svg_bitmap_cache():
+    _svg_bitmap_cache.clear()
+
 
 def open_file_with_default_app(filepath):
     if platform.system() == 'Darwin':       # macOS
@@ -309,35 +340,92 @@ def escape_path(path):
 def unescape_path(path):
     return path.replace(r'\ ', ' ')
 
-def get_path_list(path=None, prefix='', files=True, folders=True, folder_suffix='/'):
+# short-lived cache of the directory listing, so the completer will not list
+# the same folder again on every keystroke; each entry is
+# {path: (mtime, time, folders, files)}
+_path_list_cache = {}
+_path_list_cache_ttl = 2.0
+_path_list_cache_size = 16
+# maximum number of items to show in the autocomplete popup
+path_list_completion_count = 200
+
+def _list_dir(path):
+    """return the (folders, files) in path, hidden items excluded"""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return [], []
+    now = time.monotonic()
+    cached = _path_list_cache.get(path, None)
+    if cached is not None and cached[0] == mtime and \
+       now - cached[1] < _path_list_cache_ttl:
+        return cached[2], cached[3]
+
+    folders, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    folders.append(name)
+                elif '.' in name:
+                    files.append(name)
+    except OSError:
+        return [], []
+
+    if path not in _path_list_cache and \
+       len(_path_list_cache) >= _path_list_cache_size:
+        # remove the oldest one
+        oldest = min(_path_list_cache, key=lambda k: _path_list_cache[k][1])
+        _path_list_cache.pop(oldest)
+    _path_list_cache[path] = (mtime, now, folders, files)
+    return folders, files
+
+def get_path_list(path=None, prefix='', files=True, folders=True,
+                  folder_suffix='/', max_count=None):
+    """
+    return the sub-folders and files in path that start with prefix (case
+    insensitive); folders are listed first, and each part is sorted.
+
+    max_count: if not None, return at most max_count items (e.g., the number
+        of items the autocomplete popup can show).
+    """
     paths = []
     if path is None:
         path = os.getcwd()
     path = os.path.expandvars(os.path.expanduser(path))
-    def _getPathList(pattern):
-        # get folders or files
-        pattern = unescape_path(pattern)
-        f = glob.glob(pattern)
-        # remove common "path"
-        f = [os.path.relpath(folder, path) for folder in f]
+    path = unescape_path(path) or '.'
+    all_folders, all_files = _list_dir(path)
+    prefix = prefix.lower()
+
+    def _getPathList(names, count):
         # check if start with prefix
-        f = [folder for folder in f if folder.lower().startswith(prefix.lower())]
+        if prefix:
+            names = [n for n in names if n.lower().startswith(prefix)]
+        if count is None:
+            names = sorted(names, key=str.casefold)
+        else:
+            names = heapq.nsmallest(count, names, key=str.casefold)
         # replace ' ' with '\ ' or put the path in quotes to indicate it is a
         # space in path not in command
-        #if wx.Platform == '__WXMSW__':
-        #    f = [ f'"{p}"' if ' ' in p else p for p in f]
-        #else:
-        f = [escape_path(p) for p in f]
-        return f
+        return [escape_path(p) for p in names]
 
     if folders:
-        f = _getPathList(os.path.join(path, '*/'))
+        f = _getPathList(all_folders, max_count)
         if isinstance(folder_suffix, str):
             f = [folder + folder_suffix for folder in f]
-        paths += sorted(f, key=str.casefold)
+        paths += f
     if files:
-        f = _getPathList(os.path.join(path, '*.*'))
-        paths += sorted(f, key=str.casefold)
+        count = None
+        if max_count is not None:
+            count = max(max_count - len(paths), 0)
+        paths += _getPathList(all_files, count)
 
     return paths
 
@@ -358,6 +446,14 @@ def create_shortcut(name, icns, ico, svg):
         traceback.print_exc(file=sys.stdout)
     return None
 
+# process-wide LRU cache of the file icons, keyed by (extension, size, scale);
+# for '.exe'/'.ico', the icon comes from the file itself, so the key uses the
+# filename instead. None is also cached for the extension without icon, so it
+# will not query the mime type manager again (but not when it fails, which
+# may be temporary).
+_file_icon_cache = OrderedDict()
+_file_icon_cache_size = 512
+
 def get_file_icon(filename, size=16, win=None):
     """Helper function. Called for files and collects all the necessary
     icons into in image list which is re-passed into the tree every time
@@ -375,55 +471,67 @@ def get_file_icon(filename, size=16, win=None):
     ext = _getFileExtension(filename)
     ext = ext.lower()
 
+    scale = 1
+    if win is not None and not wx.Platform == '__WXMSW__':
+        scale = win.GetDPIScaleFactor()
+
+    excluded = ['', '.exe', '.ico']
+    if ext == '':
+        # do nothing if no extension found
+        return None
+    if ext in excluded:
+        key = (filename, size, scale)
+    else:
+        key = (ext, size, scale)
+    if key in _file_icon_cache:
+        _file_icon_cache.move_to_end(key)
+        return _file_icon_cache[key]
+
+    try:
+        bitmap = _load_file_icon(filename, ext, size, scale)
+    except:
+        # sometimes it just crashes
+        return None
+    _file_icon_cache[key] = bitmap
+    while len(_file_icon_cache) > _file_icon_cache_size:
+        _file_icon_cache.popitem(last=False)
+    return bitmap
+
+def clear_file_icon_cache():
+    _file_icon_cache.clear()
+
+def _load_file_icon(filename, ext, size, scale):
     def _icon2bitmap(icon):
         bitmap = wx.Bitmap()
         bitmap.CopyFromIcon(icon)
         image = bitmap.ConvertToImage()
-        scale = 1
-        if win is not None and not wx.Platform == '__WXMSW__':
-            scale = win.GetDPIScaleFactor()
         image = image.Scale(int(size*scale), int(size*scale), wx.IMAGE_QUALITY_HIGH)
         bitmap = image.ConvertToBitmap()
         bitmap.SetScaleFactor(scale)
         return bitmap
 
-    excluded = ['', '.exe', '.ico']
-    # do nothing if no extension found or in excluded list
-    if ext not in excluded:
-        # sometimes it just crashes
-        try:
-            # use mimemanager to get filetype and icon
-            # lookup extension
-            filetype = wx.TheMimeTypesManager.GetFileTypeFromExtension(
-                ext)
-
-            if hasattr(filetype, 'GetIconInfo'):
-                info = filetype.GetIconInfo()
-
-                if info is not None:
-                    icon = info[0]
-                    if not icon.IsOk():
-                        icon = wx.Icon()
-                        icon.LoadFile(info[1], type=wx.BITMAP_TYPE_ICON)
-                    if icon.IsOk():
-                        bitmap = _icon2bitmap(icon)
-
-                        return bitmap
-            return None
-        except:
-            return None
-
-    elif ext in ['.exe', '.ico']:
-        # if exe, get first icon out of it
-        try:
-            iloc = wx.IconLocation(filename, 0)
-            icon = wx.Icon(iloc)
-            if icon.IsOk():
-                bitmap = _icon2bitmap(icon)
-                return bitmap
-        except:
-            pass
+    if ext not in ['.exe', '.ico']:
+        # use mimemanager to get filetype and icon
+        # lookup extension
+        filetype = wx.TheMimeTypesManager.GetFileTypeFromExtension(ext)
+
+        if hasattr(filetype, 'GetIconInfo'):
+            info = filetype.GetIconInfo()
+
+            if info is not None:
+                icon = info[0]
+                if not icon.IsOk():
+                    icon = wx.Icon()
+                    icon.LoadFile(info[1], type=wx.BITMAP_TYPE_ICON)
+                if icon.IsOk():
+                    return _icon2bitmap(icon)
+        return None
 
+    # if exe, get first icon out of it
+    iloc = wx.IconLocation(filename, 0)
+    icon = wx.Icon(iloc)
+    if icon.IsOk():
+        return _icon2bitmap(icon)
     return None
 
 def get_latest_package_version(name, timeout=1):